@@ -0,0 +1,391 @@
+import os
+import stat
+import time
+import asyncio
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified, http_date, quote_etag, parse_accept_header, parse_range_header
+from werkzeug.utils import get_content_type
+
+from backend import (create_app, catalog_etag, listing_source, listing_key, product_listing, product_changes,
+                     parse_event_id, sse, BASE_DIR, FOOTER_FILE, SSE_HEARTBEAT)
+from storage import CHANGE_POLL_INTERVAL
+from static_files import is_immutable, is_compressible, IMMUTABLE_MAX_AGE
+from metrics import REQUEST_SECONDS, SLOW_REQUESTS
+
+# ASGI front for the same app: `backend.py serve --asgi`, or `uvicorn asgi:app`.
+# Storefront reads (listings, data.json, the delta and change feeds, static files) are
+# answered on the event loop; their store lookups, file reads and JSON encoding run in a
+# small thread pool, and sending the bytes to a slow client costs no thread at all. Open
+# change feeds share one version poll per process instead of a thread each. Every other
+# route (admin writes, uploads, moves, drafts, bulk, /metrics) goes to the Flask app
+# unchanged, in a second thread pool, so the API is the same under either server.
+THREADS = int(os.environ.get('DASHAMI_THREADS', 8))
+FILE_CHUNK_SIZE = 256 * 1024
+
+def query_args(scope):
+    return MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+
+def file_type(path):
+    return get_content_type(mimetypes.guess_type(path)[0] or 'application/octet-stream', 'utf-8')
+
+def open_file(path):
+    # (file, stat) of a regular file, or None
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return None
+    st = os.fstat(f.fileno())
+    if not stat.S_ISREG(st.st_mode):
+        f.close()
+        return None
+    return f, st
+
+def read_chunk(f, offset, size):
+    f.seek(offset)
+    return f.read(size)
+
+class Request:
+    def __init__(self, scope, receive, send, route):
+        self.scope = scope
+        self.receive = receive
+        self._send = send
+        self.route = route
+        self.method = scope['method']
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self.args = query_args(scope)
+        self.started = time.perf_counter()
+        self.status = None
+
+    @property
+    def environ(self):
+        # just enough WSGI environ for werkzeug's conditional-request helpers
+        environ = {'REQUEST_METHOD': self.method}
+        for name, value in self.headers.items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        return environ
+
+    async def start(self, status, headers):
+        self.status = status
+        await self._send({'type': 'http.response.start', 'status': status,
+                          'headers': [(k.encode('latin-1'), str(v).encode('latin-1')) for k, v in headers]})
+
+    async def write(self, body, more=True):
+        if self.method == 'HEAD':
+            body = b''
+            if more:
+                return
+        await self._send({'type': 'http.response.body', 'body': body, 'more_body': more})
+
+    async def respond(self, status, headers, body=b''):
+        if isinstance(body, str):
+            body = body.encode()
+        await self.start(status, headers + [('content-length', len(body))])
+        await self.write(body, more=False)
+
+    async def until_disconnect(self, stream):
+        # run a never-ending response until the client goes away
+        async def listen():
+            while (await self.receive())['type'] != 'http.disconnect':
+                pass
+        task, listener = asyncio.ensure_future(stream), asyncio.ensure_future(listen())
+        try:
+            done, _ = await asyncio.wait({task, listener}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            task.cancel()
+            listener.cancel()
+        if task in done and not task.cancelled() and task.exception() and not isinstance(task.exception(), OSError):
+            raise task.exception()
+
+class ChangeWatcher:
+    # the catalog version, polled once per process for all open change feeds
+    def __init__(self, server):
+        self.server = server
+        self.version = None
+        self.listeners = 0
+        self.changed = asyncio.Condition()
+        self._task = None
+
+    def subscribe(self):
+        self.listeners += 1
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._poll())
+
+    def unsubscribe(self):
+        self.listeners -= 1
+
+    async def wait(self, version, timeout):
+        # the first version after `version`, or the current one once `timeout` runs out
+        async with self.changed:
+            try:
+                await asyncio.wait_for(self.changed.wait_for(
+                    lambda: self.version is not None and self.version > version), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.version if self.version is not None else version
+
+    async def _poll(self):
+        store = self.server.resources.store
+        while self.listeners > 0:
+            try:
+                version = await self.server.run(store.current_version)
+            except Exception as e:
+                print(f"[!] Change feed poll failed: {e}")
+            else:
+                if version != self.version:
+                    async with self.changed:
+                        self.version = version
+                        self.changed.notify_all()
+            await asyncio.sleep(CHANGE_POLL_INTERVAL)
+        self._task = self.version = None
+
+class AsgiServer:
+    def __init__(self, flask_app, threads=THREADS):
+        self.flask_app = flask_app
+        self.resources = flask_app.extensions['dashami']
+        self.urls = flask_app.url_map.bind('localhost')
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='read')
+        self.wsgi = WSGIMiddleware(flask_app, workers=threads)
+        self.ready = False
+        self._changes = None
+        # blueprint endpoint -> native handler; anything else is answered by Flask
+        self.handlers = {
+            'dashami.serve_index': self.serve_static,
+            'dashami.serve_static': self.serve_static,
+            'dashami.serve_catalog': self.serve_catalog,
+            'dashami.serve_footer': self.serve_footer,
+            'dashami.check_updates': self.check_updates,
+            'dashami.catalog_events': self.catalog_events,
+            'dashami.get_products': self.get_products,
+            'dashami.get_product_changes': self.get_product_changes,
+        }
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    def prepare(self):
+        # what Flask's before_request does, plus opening the catalog
+        self.resources.prepare()
+        self.resources.store
+        self.ready = True
+
+    @property
+    def changes(self):
+        if self._changes is None:
+            self._changes = ChangeWatcher(self)
+        return self._changes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        handler = None
+        if scope['method'] in ('GET', 'HEAD'):
+            try:
+                rule, values = self.urls.match(scope['path'], 'GET', return_rule=True)
+                handler = self.handlers.get(rule.endpoint)
+            except HTTPException:
+                pass   # 404s, 405s and redirects come from Flask
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+        if not self.ready:
+            await self.run(self.prepare)
+        request = Request(scope, receive, send, rule.rule)
+        try:
+            await handler(request, **values)
+        finally:
+            self.record(request)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.run(self.prepare)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def fallback(self, request):
+        # missing files and other errors: Flask answers (and records) those exactly as it would
+        await self.wsgi(request.scope, request.receive, request._send)
+
+    def record(self, request):
+        # same series as backend.record_request; for streams this is the time to the headers
+        if request.status is None:
+            return
+        elapsed = time.perf_counter() - request.started
+        REQUEST_SECONDS.observe(elapsed, method=request.method, route=request.route, status=request.status)
+        slow = self.flask_app.config['SLOW_REQUEST_SECONDS']
+        if slow and elapsed >= slow:
+            SLOW_REQUESTS.inc(method=request.method, route=request.route)
+            query = request.scope.get('query_string', b'').decode('latin-1')
+            print(f"[slow] {elapsed * 1000:.0f}ms {request.method} {request.scope['path']}"
+                  f"{'?' + query if query else ''} -> {request.status}")
+
+    # --- Conditional JSON (runs in the pool) ---
+    def json_body(self, payload):
+        # byte for byte what jsonify() sends
+        return self.flask_app.json.response(payload).get_data()
+
+    def conditional(self, request, etag, last_modified, build):
+        # (status, headers, body) like backend.conditional_response
+        last_modified = datetime.fromtimestamp(int(last_modified), timezone.utc)
+        headers = [('etag', quote_etag(etag)), ('last-modified', http_date(last_modified)),
+                   ('cache-control', 'no-cache')]
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            return 304, headers, b''
+        status, extra, body = build()
+        if status != 200:
+            return status, extra, body
+        return 200, headers + extra, body
+
+    def catalog_read(self, request, source, key, build):
+        # backend.cached_listing: the body comes from the listing cache when it is current
+        store, cache = self.resources.store, self.resources.listing_cache
+        encoding = parse_accept_header(request.headers.get('accept-encoding')).best_match(cache.encodings)
+        tag = catalog_etag(source, store)
+
+        def respond():
+            def serialize():
+                data, status = build(store)
+                return status, self.json_body(data)
+            status, body, used = cache.get(key, tag, serialize, encoding)
+            return status, [('content-type', 'application/json')] + ([('content-encoding', used)] if used else []), body
+
+        status, headers, body = self.conditional(request, f"{tag}-{encoding}" if encoding else tag,
+                                                 store.modified_of(source), respond)
+        return status, headers + [('vary', 'Accept-Encoding')], body
+
+    # --- Catalog routes ---
+    async def get_products(self, request):
+        source, sort_by = listing_source(request.args)
+        await request.respond(*await self.run(self.catalog_read, request, source,
+                                              listing_key(source, sort_by, request.args),
+                                              lambda store: product_listing(store, source, sort_by, request.args)))
+
+    async def serve_catalog(self, request):
+        await request.respond(*await self.run(self.catalog_read, request, 'main', listing_key('main', None, {}),
+                                              lambda store: (store.all('main'), 200)))
+
+    async def get_product_changes(self, request):
+        body = await self.run(lambda: self.json_body(product_changes(self.resources.store, request.args)))
+        await request.respond(200, [('content-type', 'application/json')], body)
+
+    async def check_updates(self, request):
+        version = await self.run(self.resources.store.current_version)
+        body = self.json_body({"status": "ok", "timestamp": int(time.time()), "version": version})
+        await request.respond(200, [('content-type', 'application/json')], body)
+
+    async def catalog_events(self, request):
+        store = self.resources.store
+        since = parse_event_id(request.headers.get('last-event-id') or request.args.get('last_event_id'), store)
+        await request.start(200, [('content-type', 'text/event-stream; charset=utf-8'),
+                                  ('cache-control', 'no-cache'), ('x-accel-buffering', 'no')])
+        if request.method == 'HEAD':
+            return await request.write(b'', more=False)
+
+        async def stream():
+            version = since
+            await request.write(b"retry: 3000\n\n")
+            while True:
+                if version is None:
+                    events, current = None, await self.run(store.current_version)
+                else:
+                    events, current = await self.run(store.changes_since, version)
+                if events is None:
+                    version = current
+                    await request.write(sse('reset', {"version": version}, f"{store.epoch}-{version}").encode())
+                else:
+                    for e in events:
+                        await request.write(sse('change', e, f"{store.epoch}-{e['version']}").encode())
+                    version = current
+                if await self.changes.wait(version, SSE_HEARTBEAT) <= version:
+                    await request.write(b": ping\n\n")
+
+        self.changes.subscribe()
+        try:
+            await request.until_disconnect(stream())
+        finally:
+            self.changes.unsubscribe()
+
+    # --- Files ---
+    async def serve_static(self, request, path='main.html'):
+        if '..' in path or path.startswith('/'):
+            return await self.fallback(request)
+        full_path = os.path.join(BASE_DIR, path)
+        if is_immutable(path):
+            # content-hashed name: the bytes behind this URL never change
+            return await self.send_file(request, full_path, [('cache-control', f'public, max-age={IMMUTABLE_MAX_AGE}, immutable')])
+        if not is_compressible(path):
+            return await self.send_file(request, full_path, [('cache-control', 'no-cache')])
+        static_files = self.resources.static_files
+        encoding = parse_accept_header(request.headers.get('accept-encoding')).best_match(static_files.encodings)
+        variant = await self.run(static_files.variant, path, encoding)
+        if not variant:
+            return await self.send_file(request, full_path, [('cache-control', 'no-cache'), ('vary', 'Accept-Encoding')])
+        body, (ino, mtime_ns, size) = variant
+        status, headers, body = self.conditional(request, f"{ino}-{mtime_ns}-{size}-{encoding}", mtime_ns / 1e9,
+                                                 lambda: (200, [('content-type', file_type(path))], body))
+        await request.respond(status, headers + [('content-encoding', encoding), ('vary', 'Accept-Encoding')], body)
+
+    async def serve_footer(self, request):
+        await self.send_file(request, FOOTER_FILE, [('cache-control', 'no-cache')], etag_prefix='footer-')
+
+    async def send_file(self, request, full_path, headers, etag_prefix=''):
+        # conditional and single-range requests, read in chunks off the loop
+        opened = await self.run(open_file, full_path)
+        if opened is None:
+            return await self.fallback(request)
+        f, st = opened
+        try:
+            etag = f"{etag_prefix}{st.st_ino}-{st.st_mtime_ns}-{st.st_size}"
+            last_modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+            headers = headers + [('etag', quote_etag(etag)), ('last-modified', http_date(last_modified)),
+                                 ('accept-ranges', 'bytes')]
+            environ = request.environ
+            if not is_resource_modified(environ, etag=etag, last_modified=last_modified):
+                return await request.respond(304, headers)
+            start, end, status = 0, st.st_size, 200
+            ranges = parse_range_header(request.headers.get('range'))
+            # If-Range: a range only applies to the version of the file the client already has
+            if ranges and ('HTTP_IF_RANGE' not in environ or not is_resource_modified(
+                    environ, etag=etag, last_modified=last_modified, ignore_if_range=False)):
+                span = ranges.range_for_length(st.st_size)
+                if span is None:
+                    return await request.respond(416, headers + [('content-range', f"bytes */{st.st_size}")])
+                (start, end), status = span, 206
+                headers.append(('content-range', f"bytes {start}-{end - 1}/{st.st_size}"))
+            await request.start(status, headers + [('content-type', file_type(full_path)),
+                                                   ('content-length', end - start)])
+            if request.method == 'HEAD':
+                return await request.write(b'', more=False)
+            offset = start
+            while offset < end:
+                chunk = await self.run(read_chunk, f, offset, min(FILE_CHUNK_SIZE, end - offset))
+                if not chunk:
+                    break
+                offset += len(chunk)
+                await request.write(chunk, more=offset < end)
+            if offset < end:
+                await request.write(b'', more=False)   # file shrank while sending
+        finally:
+            f.close()
+
+def create_asgi_app(config=None, threads=THREADS):
+    return AsgiServer(create_app(config), threads)
+
+def __getattr__(name):
+    # `uvicorn asgi:app`: a default app, built on first access
+    global app
+    if name == 'app':
+        app = create_asgi_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,3 +1,4 @@
+import io
 import os
 import sys
 import subprocess
@@ -9,8 +10,16 @@ import re
 import socket
 import uuid
 import time
+import atexit
+import base64
+import mimetypes
+import hashlib
+import csv
+import tempfile
+import importlib.util
 from functools import wraps
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
 # --- 1. AUTO-INSTALLER ---
 def install(package):
@@ -18,11 +27,18 @@ def install(package):
     subprocess.check_call([sys.executable, "-m", "pip", "install", package])
 
 try:
-    from flask import Flask, request, jsonify, send_from_directory
+    from flask import Blueprint, Flask, current_app, g, request, jsonify, send_from_directory, make_response, stream_with_context
     from flask_cors import CORS
-    from PIL import Image, ImageOps
+    from werkzeug.local import LocalProxy
     from werkzeug.utils import secure_filename
+    from werkzeug.http import is_resource_modified
+    # Pillow is imported on first use (see pil()); only check that it is there
+    if importlib.util.find_spec('PIL') is None:
+        raise ImportError("No module named 'PIL'")
 except ImportError:
+    # only the interactive dev script installs packages; `serve` and imports by a WSGI server fail loudly
+    if __name__ != '__main__' or sys.argv[1:2] == ['serve']:
+        raise
     try:
         install("flask")
         install("flask-cors")
@@ -33,27 +49,64 @@ except ImportError:
         input(f"Error: {e}")
         sys.exit(1)
 
-# --- 2. CONFIGURATION ---
-app = Flask(__name__, static_folder='.', static_url_path='')
-CORS(app, resources={r"/*": {"origins": "localhost"}})
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
+from storage import load_json, save_json, file_lock, process_lock, CatalogStore, SqliteCatalogStore, FACETS
+from static_files import StaticFiles, is_immutable, is_compressible, IMMUTABLE_MAX_AGE
+from metrics import REGISTRY, REQUEST_SECONDS, SLOW_REQUESTS, IMAGE_SECONDS
+from image_gc import ImageCollector, GC_INTERVAL, GC_GRACE, GC_BATCH_SIZE
+from drafts import DraftStore, DEFAULT_KEY, DRAFT_TTL, valid_key
+from listing_cache import ListingCache, DEFAULT_MAX_BYTES as LISTING_CACHE_BYTES
 
+# --- 2. CONFIGURATION ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_FILE = os.path.join(BASE_DIR, 'data.json')
 TRASH_FILE = os.path.join(BASE_DIR, 'trash.json')
 DRAFT_FILE = os.path.join(BASE_DIR, 'draft.json')
 UNFILLED_FILE = os.path.join(BASE_DIR, 'unfilled.json')
 BACKUP_FILE = os.path.join(BASE_DIR, 'data.json.bak')
+FOOTER_FILE = os.path.join(BASE_DIR, 'footer.json')
+JOURNAL_FILE = os.path.join(BASE_DIR, 'journal.jsonl')
+DB_FILE = os.path.join(BASE_DIR, 'catalog.db')
+COUNTER_FILE = os.path.join(BASE_DIR, 'counter.json')
+GC_STATE_FILE = os.path.join(BASE_DIR, 'gc.json')
+PUBLISH_LOCK = os.path.join(BASE_DIR, 'publish')   # publish.lock, see publishing()
+EXPORT_DIR = os.path.join(BASE_DIR, 'site')
 
 IMAGE_DIR = os.path.join(BASE_DIR, 'images')
 BUFFER_DIR = os.path.join(IMAGE_DIR, 'buffer')
 TRASH_IMG_DIR = os.path.join(IMAGE_DIR, 'trash')
 
 PORT = 8000
+STORAGE_BACKEND = os.environ.get('DASHAMI_STORAGE', 'json')  # 'json' or 'sqlite'
 ADMIN_API_KEY = os.environ.get('DASHAMI_API_KEY', 'dev-key-change-in-production')
+SLOW_REQUEST_SECONDS = float(os.environ.get('DASHAMI_SLOW_REQUEST_SECONDS') or 0) or None
+
+SSE_HEARTBEAT = 15
+IMAGE_WORKERS = 2
+IMAGE_QUEUE_LIMIT = 32
+JOB_TTL = 3600
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024        # advertised to clients; each PUT must fit MAX_CONTENT_LENGTH
+MAX_VIDEO_SIZE = 1024 * 1024 * 1024        # chunked uploads only; single requests stay at 50MB
+UPLOAD_TTL = 24 * 3600                     # unfinished chunked uploads are dropped after this
+VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi'}
+
+HASH_LENGTH = 32   # hex chars of sha256 used for stored image names
+DERIVATIVE_WIDTHS = [320, 640, 1280]
+PLACEHOLDER_WIDTH = 16
+DERIVATIVE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp'}
+
+BULK_MAX_ROWS = 5000
+BULK_BATCH_SIZE = 500      # streaming imports commit every this many rows
+BULK_FIELDS = ['id', 'name', 'category', 'fabric', 'color', 'price', 'discount_price', 'desc',
+               'stars', 'stock', 'stock_count', 'image', 'gallery']
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+QUERY_PARAMS = ('limit', 'cursor', 'q', 'min_price', 'max_price') + FACETS
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'mp4', 'mov', 'avi'}
 
+MAX_DRAFT_SIZE = 256 * 1024   # bytes of JSON per draft write
+
 INPUT_LIMITS = {
     'name': 200,
     'desc': 5000,
@@ -65,21 +118,186 @@ INPUT_LIMITS = {
     'stock_count': 99999
 }
 
-for d in [IMAGE_DIR, BUFFER_DIR, TRASH_IMG_DIR]:
-    if not os.path.exists(d): 
-        os.makedirs(d)
+# create_app() settings; anything not given falls back to these
+DEFAULT_CONFIG = {
+    'MAX_CONTENT_LENGTH': 50 * 1024 * 1024,
+    'STORAGE_BACKEND': STORAGE_BACKEND,
+    'ADMIN_API_KEY': ADMIN_API_KEY,
+    'IMAGE_WORKERS': IMAGE_WORKERS,
+    'PREBUILD_STATIC': True,   # compress text assets in the background once the first request arrives
+    'METRICS_ENABLED': True,   # GET /metrics in the Prometheus text format
+    'SLOW_REQUEST_SECONDS': SLOW_REQUEST_SECONDS,   # log requests slower than this; None turns the log off
+    'GC_INTERVAL': int(os.environ.get('DASHAMI_GC_INTERVAL', GC_INTERVAL)),   # seconds; 0 runs passes only on request
+    'GC_GRACE': GC_GRACE,            # unreferenced files younger than this are kept
+    'GC_BATCH_SIZE': GC_BATCH_SIZE,
+    'DRAFT_TTL': DRAFT_TTL,          # seconds; drafts untouched this long are dropped before a GC pass
+    # serialized /api/products and /data.json bodies kept per process; 0 turns the cache off
+    'LISTING_CACHE_BYTES': int(os.environ.get('DASHAMI_LISTING_CACHE_MB') or LISTING_CACHE_BYTES // 2**20) * 2**20,
+}
+
+def ensure_data_files():
+    for d in [IMAGE_DIR, BUFFER_DIR, TRASH_IMG_DIR]:
+        # several workers may get here at once
+        os.makedirs(d, exist_ok=True)
+
+    for f in [DATA_FILE, TRASH_FILE, DRAFT_FILE, UNFILLED_FILE]:
+        try:
+            with open(f, 'x') as file: 
+                json.dump([] if f != DRAFT_FILE else {}, file)
+        except FileExistsError:
+            pass
+
+def open_json_store():
+    return CatalogStore(
+        {'main': DATA_FILE, 'unfilled': UNFILLED_FILE, 'trash': TRASH_FILE},
+        backups={'main': BACKUP_FILE},
+        journal=JOURNAL_FILE,
+        counter=COUNTER_FILE
+    )
+
+def open_sqlite_store():
+    db = SqliteCatalogStore(DB_FILE)
+    if not db.get_meta('migrated_from_json'):
+        print(f"[*] Migrating JSON catalog into {DB_FILE}...")
+        db.import_from(open_json_store())
+    return db
+
+class Resources:
+    # Everything that touches the disk or starts threads, opened the first time it is needed,
+    # so importing this module or calling create_app() is cheap (test collection, worker boot).
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.ready = False
+        self._store = None
+        self._static_files = None
+        self._image_pool = None
+        self._image_gc = None
+        self._drafts = None
+        self._listing_cache = None
+
+    def prepare(self):
+        # runs before every request; only the first one does any work
+        if self.ready:
+            return
+        with self.lock:
+            if not self.ready:
+                ensure_data_files()
+                REGISTRY.start_flusher()
+                self.ready = True
+        self.image_gc.start()
+
+    @property
+    def store(self):
+        if self._store is None:
+            self.prepare()
+            with self.lock:
+                if self._store is None:
+                    backend = self.config['STORAGE_BACKEND']
+                    self._store = open_sqlite_store() if backend == 'sqlite' else open_json_store()
+                    atexit.register(self._store.compact)
+        return self._store
+
+    @property
+    def static_files(self):
+        if self._static_files is None:
+            with self.lock:
+                if self._static_files is None:
+                    self._static_files = StaticFiles(BASE_DIR)
+                    if self.config['PREBUILD_STATIC']:
+                        threading.Thread(target=self._static_files.prebuild, daemon=True).start()
+        return self._static_files
+
+    @property
+    def image_gc(self):
+        if self._image_gc is None:
+            with self.lock:
+                if self._image_gc is None:
+                    self._image_gc = ImageCollector(
+                        BASE_DIR, ['images/buffer', 'images', 'images/trash'],
+                        self.referenced_images, GC_STATE_FILE,
+                        interval=self.config['GC_INTERVAL'], grace=self.config['GC_GRACE'],
+                        batch_size=self.config['GC_BATCH_SIZE'])
+        return self._image_gc
+
+    def referenced_images(self):
+        # what the image GC must keep; abandoned drafts expire first so their uploads can go
+        self.drafts.expire()
+        return self.store.referenced_files() | self.drafts.files()
+
+    @property
+    def drafts(self):
+        if self._drafts is None:
+            with self.lock:
+                if self._drafts is None:
+                    self._drafts = DraftStore(DRAFT_FILE, ttl=self.config['DRAFT_TTL'])
+                    atexit.register(self._drafts.flush)
+        return self._drafts
+
+    @property
+    def listing_cache(self):
+        if self._listing_cache is None:
+            with self.lock:
+                if self._listing_cache is None:
+                    self._listing_cache = ListingCache(self.config['LISTING_CACHE_BYTES'])
+        return self._listing_cache
+
+    @property
+    def image_pool(self):
+        if self._image_pool is None:
+            with self.lock:
+                if self._image_pool is None:
+                    self._image_pool = ThreadPoolExecutor(max_workers=self.config['IMAGE_WORKERS'],
+                                                          thread_name_prefix='image')
+        return self._image_pool
+
+def resources():
+    return current_app.extensions['dashami']
 
-for f in [DATA_FILE, TRASH_FILE, DRAFT_FILE, UNFILLED_FILE]:
-    if not os.path.exists(f):
-        with open(f, 'w') as file: 
-            json.dump([] if f != DRAFT_FILE else {}, file)
+# module-level names the routes use; each resolves to the current app's resources
+store = LocalProxy(lambda: resources().store)
+static_files = LocalProxy(lambda: resources().static_files)
+image_gc = LocalProxy(lambda: resources().image_gc)
+drafts = LocalProxy(lambda: resources().drafts)
+image_pool = LocalProxy(lambda: resources().image_pool)
+listing_cache = LocalProxy(lambda: resources().listing_cache)
+
+_pil = None
+
+def pil():
+    # (Image, ImageOps, features), imported the first time an image is processed
+    global _pil
+    if _pil is None:
+        from PIL import Image, ImageOps, features
+        _pil = (Image, ImageOps, features)
+    return _pil
+
+bp = Blueprint('dashami', __name__)
+
+def create_app(config=None):
+    # files are served by serve_static (caching headers, precompression), not Flask's static route
+    app = Flask(__name__, static_folder=None)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+    CORS(app, resources={r"/*": {"origins": "localhost"}})
+    app.extensions['dashami'] = Resources(app.config)
+    app.register_blueprint(bp)
+    return app
+
+def __getattr__(name):
+    # `backend.app` / `gunicorn backend:app`: a default app, built on first access
+    global app
+    if name == 'app':
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- 3. AUTHENTICATION DECORATOR ---
 def require_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         api_key = request.headers.get('X-API-Key')
-        if api_key != ADMIN_API_KEY:
+        if api_key != current_app.config['ADMIN_API_KEY']:
             return jsonify({"error": "Unauthorized"}), 401
         return f(*args, **kwargs)
     return decorated
@@ -107,6 +325,31 @@ def validate_number(value, max_val=None):
 def validate_stock_status(status):
     return status in ['in_stock', 'out_of_stock']
 
+def validate_product(data, draft=False):
+    # error message for an add-product / save-incomplete / bulk payload, or None when it is valid
+    raw_id = data.get("id")
+    if not isinstance(raw_id, str) or not re.match(r'^[a-zA-Z0-9\-_]+$', raw_id.strip()):
+        return "Invalid product ID"
+    if not validate_input('name', data.get("name", "")):
+        return "Invalid name (max 200 chars)"
+    if not validate_input('desc', data.get("desc") or ""):
+        return "Invalid description (max 5000 chars)"
+    for field in ('category', 'fabric', 'color'):
+        if data.get(field) is not None and not validate_input(field, data[field]):
+            return f"Invalid {field} (max {INPUT_LIMITS[field]} chars)"
+    for field in ('price', 'discount_price'):
+        if validate_number(data.get(field), INPUT_LIMITS[field]) is False:
+            return f"Invalid {field.replace('_', ' ')}"
+    if not draft and not validate_stock_status(data.get("stock", "in_stock")):
+        return "Invalid stock status"
+    if validate_number(data.get("stock_count", 0), INPUT_LIMITS['stock_count']) is False:
+        return "Invalid stock count"
+    try:
+        int(data.get("stars", 5))
+    except (TypeError, ValueError):
+        return "Invalid stars"
+    return None
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -122,115 +365,386 @@ def get_local_ip():
         s.close()
     return IP
 
-def load_json(path, default_type=[]):
-    if not os.path.exists(path): 
-        return default_type
-    try:
-        with open(path, 'r') as f: 
-            content = f.read().strip()
-            return json.loads(content) if content else default_type
-    except: 
-        return default_type
+def conditional_response(etag, last_modified, build):
+    # 304 without building the body when the client's copy is current
+    last_modified = datetime.fromtimestamp(int(last_modified), timezone.utc)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-def save_json(path, data):
-    if path == DATA_FILE and os.path.exists(DATA_FILE):
-        try: 
-            shutil.copyfile(DATA_FILE, BACKUP_FILE)
-        except: 
-            pass
-    with open(path, 'w') as f: 
-        json.dump(data, f, indent=4)
+def catalog_etag(name, catalog=store):
+    return f"{catalog.epoch}-{name}-{catalog.version_of(name)}"
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-def finalize_filename(rel_path, new_base_name):
+def content_hash(path):
+    return sha256_file(path)[:HASH_LENGTH]
+
+def check_upload(rel_path):
+    # waits for a buffer image that is still being processed; ValueError when the upload
+    # never produced a file (processing failed, or the buffer copy is gone)
+    if rel_path and "buffer" in rel_path:
+        wait_for_image(rel_path)
+        filename = os.path.basename(rel_path)
+        if not os.path.exists(os.path.join(BUFFER_DIR, filename)):
+            raise ValueError(f"Image upload failed or expired: {filename}")
+
+def finalize_filename(rel_path):
+    # images are stored once under their content hash; an identical file already in
+    # images/ is reused and the buffer copy dropped
     if not rel_path or "buffer" not in rel_path: 
         return rel_path
+    check_upload(rel_path)
     filename = os.path.basename(rel_path)
     full_src = os.path.join(BUFFER_DIR, filename)
-    if not os.path.exists(full_src): 
-        return rel_path
-    ext = os.path.splitext(filename)[1]
-    unique_id = uuid.uuid4().hex[:8]
-    new_name = f"{new_base_name}_{unique_id}{ext}"
-    full_dest = os.path.join(IMAGE_DIR, new_name)
     try:
-        if os.path.exists(full_dest): 
-            os.remove(full_dest)
-        shutil.move(full_src, full_dest)
+        with IMAGE_SECONDS.time(op='finalize'):
+            new_name = content_hash(full_src) + os.path.splitext(filename)[1].lower()
+            full_dest = os.path.join(IMAGE_DIR, new_name)
+            if os.path.exists(full_dest):
+                os.remove(full_src)
+            else:
+                os.replace(full_src, full_dest)
+            # a fresh mtime keeps the image GC off the file until the product pointing at it is
+            # stored; a moved upload would otherwise keep the buffer copy's age
+            os.utime(full_dest)
         return f"images/{new_name}"
     except Exception as e:
         print(f"[!] Image move failed: {e}")
         return rel_path
 
-def move_to_trash(rel_path):
-    if not rel_path: 
-        return ""
-    filename = os.path.basename(rel_path)
-    if "buffer" in rel_path: 
-        full_src = os.path.join(BUFFER_DIR, filename)
-    else: 
-        full_src = os.path.join(IMAGE_DIR, filename)
-    if not os.path.exists(full_src): 
-        return rel_path
-    full_dest = os.path.join(TRASH_IMG_DIR, filename)
+# --- 6. IMAGE PROCESSING ---
+# Uploads are written to the buffer as-is and decoded / re-encoded on a small
+# worker pool; the upload request returns the final buffer URL and a job id straight
+# away. The admin polls GET /api/upload/<job_id> before using the URL, and publishing
+# rejects an image whose job failed (check_upload).
+upload_futures = {}   # buffer url -> future, so publishing can wait for a pending upload
+jobs_lock = threading.Lock()
+
+# Job status is job_<id>.json in the buffer, {"id", "status", "progress", "url", "error",
+# "updated"}, so every server process answers GET /api/upload/<job_id> the same way
+# whichever one took the upload. The futures only exist in that one.
+def job_path(job_id):
+    if not re.match(r'^[0-9a-f]{12}$', job_id or ''):
+        return None
+    return os.path.join(BUFFER_DIR, f"job_{job_id}.json")
+
+def set_job(job_id, **fields):
+    path = job_path(job_id)
+    with jobs_lock:
+        job = load_json(path, {})
+        job.update(fields, updated=time.time())
+        save_json(path, job)
+
+def pending_jobs():
+    # jobs waiting on this process's worker pool
+    with jobs_lock:
+        return sum(1 for f in upload_futures.values() if not f.done())
+
+def prune_jobs():
+    cutoff = time.time() - JOB_TTL
+    with jobs_lock:
+        for url, future in list(upload_futures.items()):
+            if future.done():
+                del upload_futures[url]
+    for f in os.listdir(BUFFER_DIR):
+        path = os.path.join(BUFFER_DIR, f)
+        try:
+            if f.startswith('job_') and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def process_image(job_id, raw_path, out_path):
+    set_job(job_id, status='processing', progress=10)
+    tmp_path = out_path + '.part'
     try:
-        if os.path.exists(full_dest): 
-            os.remove(full_dest)
-        shutil.move(full_src, full_dest)
-        return f"images/trash/{filename}"
-    except:
-        return rel_path
+        Image, ImageOps, _ = pil()
+        with IMAGE_SECONDS.time(op='process'), Image.open(raw_path) as img:
+            img = ImageOps.exif_transpose(img)
+            set_job(job_id, progress=50)
+            if out_path.endswith('.jpg'):
+                img.convert('RGB').save(tmp_path, 'JPEG', quality=90, optimize=True)
+            else:
+                if img.mode != 'RGBA': 
+                    img = img.convert('RGBA')
+                img.save(tmp_path, 'PNG')
+        os.replace(tmp_path, out_path)
+        set_job(job_id, status='done', progress=100)
+    except Exception as e:
+        print(f"[!] Image processing failed: {e}")
+        set_job(job_id, status='error', error=str(e))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
 
-def move_from_trash(rel_path):
-    if not rel_path: 
-        return ""
-    filename = os.path.basename(rel_path)
-    full_src = os.path.join(TRASH_IMG_DIR, filename)
-    if not os.path.exists(full_src): 
-        return rel_path
-    full_dest = os.path.join(IMAGE_DIR, filename)
+def submit_image_job(raw_path, out_path, url):
+    prune_jobs()
+    job_id = uuid.uuid4().hex[:12]
+    set_job(job_id, id=job_id, status="queued", progress=0, url=url, error=None)
+    with jobs_lock:
+        upload_futures[url] = image_pool.submit(process_image, job_id, raw_path, out_path)
+    return job_id
+
+def wait_for_image(rel_path, timeout=120):
+    with jobs_lock:
+        future = upload_futures.get(rel_path)
+    if future:
+        try:
+            future.result(timeout)
+        except Exception:
+            pass
+        return
+    # with several server processes the job may be running in another one; its raw file
+    # stays in the buffer until the processed image is in place
+    raw_prefix = f"raw_{os.path.splitext(os.path.basename(rel_path))[0]}."
+    deadline = time.time() + timeout
+    while time.time() < deadline and any(f.startswith(raw_prefix) for f in os.listdir(BUFFER_DIR)):
+        time.sleep(0.1)
+
+# Responsive derivatives: every finalized image gets downscaled WebP copies next to it
+# (<name>_w320.webp, ...) plus an inline blurred placeholder. Recorded on the product as
+# "derivatives": {image path: {"320": path, "640": path, "1280": path, "placeholder": data URI}}
+def derivative_path(rel_path, width):
+    folder, filename = os.path.split(rel_path)
+    return f"{folder}/{os.path.splitext(filename)[0]}_w{width}.webp"
+
+def make_derivatives(rel_path):
+    if not rel_path or "buffer" in rel_path or os.path.splitext(rel_path)[1].lower() not in DERIVATIVE_EXTENSIONS:
+        return None
+    src = os.path.join(BASE_DIR, rel_path)
+    Image, ImageOps, features = pil()
+    if not os.path.exists(src) or not features.check('webp'):
+        return None
+    result = {}
     try:
-        if os.path.exists(full_dest): 
-            os.remove(full_dest)
-        shutil.move(full_src, full_dest)
-        return f"images/{filename}"
-    except:
-        return rel_path
+        with IMAGE_SECONDS.time(op='derivatives'), Image.open(src) as img:
+            img.draft('RGB', (DERIVATIVE_WIDTHS[-1], DERIVATIVE_WIDTHS[-1]))
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA')
+            for width in DERIVATIVE_WIDTHS:
+                if width >= img.width:
+                    break
+                path = derivative_path(rel_path, width)
+                full_path = os.path.join(BASE_DIR, path)
+                if not os.path.exists(full_path):
+                    height = max(1, round(img.height * width / img.width))
+                    img.resize((width, height), Image.LANCZOS).save(full_path + '.part', 'WEBP', quality=80)
+                    os.replace(full_path + '.part', full_path)
+                result[str(width)] = path
+            tiny = img.copy()
+            tiny.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4))
+            buf = io.BytesIO()
+            tiny.save(buf, 'WEBP', quality=30)
+            result['placeholder'] = "data:image/webp;base64," + base64.b64encode(buf.getvalue()).decode()
+    except Exception as e:
+        print(f"[!] Derivatives failed for {rel_path}: {e}")
+        return None
+    return result
+
+def build_derivatives(paths, previous=None):
+    # images that kept their path reuse the previous entry instead of being decoded again
+    previous = previous or {}
+    todo = [p for p in dict.fromkeys(paths) if p and p not in previous]
+    fresh = dict(zip(todo, image_pool.map(make_derivatives, todo)))
+    derivatives = {}
+    for path in dict.fromkeys(paths):
+        entry = previous.get(path) or fresh.get(path)
+        if entry:
+            derivatives[path] = entry
+    return derivatives
+
+def previous_derivatives(pid):
+    _, item = store.find(pid, ['main', 'unfilled', 'trash'])
+    return (item or {}).get('derivatives') or {}
 
-# --- 6. API ROUTES ---
+# --- 7. API ROUTES ---
+@bp.before_app_request
+def prepare_resources():
+    resources().prepare()
+    g.request_started = time.perf_counter()
 
-@app.route('/')
+@bp.after_app_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=response.status_code)
+    slow = current_app.config['SLOW_REQUEST_SECONDS']
+    if slow and elapsed >= slow:
+        SLOW_REQUESTS.inc(method=request.method, route=route)
+        print(f"[slow] {elapsed * 1000:.0f}ms {request.method} {request.full_path.rstrip('?')} -> {response.status_code}")
+    return response
+
+@bp.route('/metrics')
+def metrics():
+    if not current_app.config['METRICS_ENABLED']:
+        return "Not Found", 404
+    return current_app.response_class(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/')
 def serve_index(): 
-    return send_from_directory('.', 'main.html')
+    return serve_static('main.html')
 
-@app.route('/<path:path>')
+@bp.route('/<path:path>')
 def serve_static(path):
     if '..' in path or path.startswith('/'):
         return "Not Found", 404
-    return send_from_directory('.', path)
+    if is_immutable(path):
+        # content-hashed name: the bytes behind this URL never change
+        response = send_from_directory(BASE_DIR, path, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    if not is_compressible(path):
+        # send_from_directory answers Range requests, which video seeking relies on
+        return send_from_directory(BASE_DIR, path)
+    encoding = request.accept_encodings.best_match(static_files.encodings)
+    variant = static_files.variant(path, encoding)
+    if variant:
+        body, (ino, mtime_ns, size) = variant
+        response = conditional_response(f"{ino}-{mtime_ns}-{size}-{encoding}", mtime_ns / 1e9, lambda: current_app.response_class(
+            body, mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream'))
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(BASE_DIR, path)
+        response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@bp.route('/data.json')
+def serve_catalog():
+    # data.json on disk lags behind the journal until the next compaction
+    return cached_listing('main', listing_key('main', None, {}), lambda: (store.all('main'), 200))
+
+@bp.route('/footer.json')
+def serve_footer():
+    st = os.stat(FOOTER_FILE) if os.path.exists(FOOTER_FILE) else None
+    if not st:
+        return "Not Found", 404
+    etag = f"footer-{st.st_ino}-{st.st_mtime_ns}-{st.st_size}"
+    return conditional_response(etag, st.st_mtime, lambda: send_from_directory(BASE_DIR, 'footer.json', conditional=False))
 
-@app.route('/api/check-updates', methods=['GET'])
+@bp.route('/api/check-updates', methods=['GET'])
 def check_updates():
-    return jsonify({"status": "ok", "timestamp": int(time.time())}), 200
+    return jsonify({"status": "ok", "timestamp": int(time.time()), "version": store.current_version()}), 200
+
+# --- CHANGE FEED (Server-Sent Events) ---
+def sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def parse_event_id(value, catalog=store):
+    # ids are "<epoch>-<version>"; ids from a previous server run cannot be resumed
+    epoch, _, version = (value or '').rpartition('-')
+    if epoch != catalog.epoch or not version.isdigit():
+        return None
+    return int(version)
+
+@bp.route('/api/events', methods=['GET'])
+def catalog_events():
+    since = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+
+    def stream():
+        version = since
+        yield "retry: 3000\n\n"
+        while True:
+            events, current = (None, store.current_version()) if version is None else store.changes_since(version)
+            if events is None:
+                # new client or too far behind: it has to reload, then follows from here
+                version = current
+                yield sse('reset', {"version": version}, f"{store.epoch}-{version}")
+            else:
+                for e in events:
+                    yield sse('change', e, f"{store.epoch}-{e['version']}")
+                version = current
+            if store.wait_for_change(version, SSE_HEARTBEAT) <= version:
+                yield ": ping\n\n"
+
+    return current_app.response_class(stream_with_context(stream()), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- DRAFTS (one per admin session or product, autosaved) ---
+#   GET    /api/drafts          -> {"drafts": [{key, id, name, updated}]}
+#   GET    /api/drafts/<key>    -> {key, data, updated}
+#   PUT    /api/drafts/<key>    whole draft
+#   PATCH  /api/drafts/<key>    changed fields only (JSON merge patch: null removes a field)
+#   DELETE /api/drafts/<key>
+# /api/draft is the single-draft API from before, on the "default" key.
+def draft_body():
+    if (request.content_length or 0) > MAX_DRAFT_SIZE:
+        return None, (jsonify({"error": f"Draft too large (max {MAX_DRAFT_SIZE // 1024}KB)"}), 413)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, (jsonify({"error": "Draft must be a JSON object"}), 400)
+    return data, None
+
+def draft_response(key, draft):
+    return {"key": key, "data": draft["data"], "updated": draft["updated"]}
+
+@bp.route('/api/drafts', methods=['GET'])
+@require_auth
+def list_drafts():
+    drafts.expire()
+    items = [{"key": key, "id": (d.get("data") or {}).get("id"), "name": (d.get("data") or {}).get("name"),
+              "updated": d.get("updated")} for key, d in drafts.all().items()]
+    return jsonify({"drafts": sorted(items, key=lambda d: d["updated"] or 0, reverse=True)}), 200
+
+@bp.route('/api/drafts/<key>', methods=['GET', 'PUT', 'PATCH', 'DELETE'])
+@require_auth
+def manage_drafts(key):
+    if not valid_key(key):
+        return jsonify({"error": "Invalid draft key"}), 400
+    if request.method == 'GET':
+        draft = drafts.get(key)
+        if draft is None:
+            return jsonify({"error": "No draft"}), 404
+        return jsonify(draft_response(key, draft)), 200
+    if request.method == 'DELETE':
+        # its uploads are left to the image GC, which keeps anything another draft still uses
+        drafts.delete(key)
+        image_gc.trigger()
+        return jsonify({"status": "cleared"}), 200
+    data, error = draft_body()
+    if error:
+        return error
+    draft = drafts.put(key, data) if request.method == 'PUT' else drafts.patch(key, data)
+    return jsonify({"status": "saved", "updated": draft["updated"]}), 200
 
-# --- DRAFT SYSTEM (Single Working Draft) ---
-@app.route('/api/draft', methods=['GET', 'POST', 'DELETE'])
+@bp.route('/api/draft', methods=['GET', 'POST', 'DELETE'])
 @require_auth
 def manage_draft():
     if request.method == 'GET': 
-        return jsonify(load_json(DRAFT_FILE, {})), 200
+        draft = drafts.get(DEFAULT_KEY)
+        return jsonify(draft["data"] if draft else {}), 200
     if request.method == 'POST': 
-        save_json(DRAFT_FILE, request.json)
+        data, error = draft_body()
+        if error:
+            return error
+        drafts.put(DEFAULT_KEY, data)
         return jsonify({"status": "saved"}), 200
     if request.method == 'DELETE':
-        save_json(DRAFT_FILE, {})
-        for f in os.listdir(BUFFER_DIR):
-            try: 
-                os.remove(os.path.join(BUFFER_DIR, f))
-            except: 
-                pass
+        drafts.delete(DEFAULT_KEY)
+        image_gc.trigger()
         return jsonify({"status": "cleared"}), 200
 
-@app.route('/api/upload', methods=['POST'])
+@bp.route('/api/upload', methods=['POST'])
 @require_auth
 def upload_file():
     try:
@@ -245,132 +759,220 @@ def upload_file():
         if file.content_length and file.content_length > 50 * 1024 * 1024:
             return jsonify({"error": "File too large (max 50MB)"}), 400
         
-        ext = os.path.splitext(filename)[1].lower()
-        temp_name = f"temp_{int(time.time())}_{uuid.uuid4().hex[:8]}{ext}"
-        save_path = os.path.join(BUFFER_DIR, temp_name)
-        
-        if ext in ['.mp4', '.mov', '.avi']: 
-            file.save(save_path)
-        else:
-            img = Image.open(file.stream)
-            img = ImageOps.exif_transpose(img)
-            if img.mode != 'RGBA': 
-                img = img.convert('RGBA')
-            save_path = save_path.replace(ext, '.png')
-            img.save(save_path, 'PNG')
-        
-        return jsonify({"status": "success", "url": f"images/buffer/{os.path.basename(save_path)}"}), 200
+        return buffer_upload(os.path.splitext(filename)[1].lower(), file.save)
     except Exception as e: 
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/save-incomplete', methods=['POST'])
+def buffer_upload(ext, save):
+    # save(path) writes the received file; videos stay as-is, images go to the worker pool
+    temp_name = f"temp_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    if ext in VIDEO_EXTENSIONS: 
+        save(os.path.join(BUFFER_DIR, temp_name + ext))
+        return jsonify({"status": "success", "url": f"images/buffer/{temp_name}{ext}"}), 200
+    
+    if pending_jobs() >= IMAGE_QUEUE_LIMIT:
+        return jsonify({"error": "Image queue is full, try again shortly"}), 503
+    out_ext = '.jpg' if ext in ['.jpg', '.jpeg'] else '.png'
+    raw_path = os.path.join(BUFFER_DIR, f"raw_{temp_name}{ext}")
+    save(raw_path)
+    url = f"images/buffer/{temp_name}{out_ext}"
+    job_id = submit_image_job(raw_path, os.path.join(BUFFER_DIR, temp_name + out_ext), url)
+    return jsonify({"status": "success", "url": url, "job_id": job_id}), 200
+
+@bp.route('/api/upload/<job_id>', methods=['GET'])
+@require_auth
+def upload_status(job_id):
+    path = job_path(job_id)
+    job = load_json(path, None) if path else None
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job), 200
+
+# --- CHUNKED UPLOADS (resumable) ---
+#   POST   /api/uploads                 {filename, size, sha256?} -> {upload_id, offset, chunk_size}
+#   PUT    /api/uploads/<id>?offset=N   raw bytes written at N; re-sending from an earlier offset overwrites
+#   GET    /api/uploads/<id>            -> {offset, size}, where an interrupted client resumes from
+#   POST   /api/uploads/<id>/complete   {sha256?} -> same response as /api/upload
+#   DELETE /api/uploads/<id>
+# The state is upload_<id>.json next to upload_<id>.part in the buffer, so it survives a restart.
+def upload_paths(upload_id):
+    if not re.match(r'^[0-9a-f]{32}$', upload_id or ''):
+        return None, None
+    base = os.path.join(BUFFER_DIR, f"upload_{upload_id}")
+    return base + '.json', base + '.part'
+
+def part_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def prune_uploads():
+    cutoff = time.time() - UPLOAD_TTL
+    for f in os.listdir(BUFFER_DIR):
+        path = os.path.join(BUFFER_DIR, f)
+        try:
+            if f.startswith('upload_') and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+@bp.route('/api/uploads', methods=['POST'])
+@require_auth
+def init_upload():
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not allowed_file(filename):
+        return jsonify({"error": "File type not allowed"}), 400
+    ext = os.path.splitext(filename)[1].lower()
+    limit = MAX_VIDEO_SIZE if ext in VIDEO_EXTENSIONS else current_app.config['MAX_CONTENT_LENGTH']
+    size = validate_number(data.get('size'), limit)
+    if size is False or size <= 0:
+        return jsonify({"error": f"Invalid size (max {limit // (1024 * 1024)}MB)"}), 400
+    checksum = str(data.get('sha256') or '').lower()
+    if checksum and not re.match(r'^[0-9a-f]{64}$', checksum):
+        return jsonify({"error": "Invalid sha256"}), 400
+
+    prune_uploads()
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = upload_paths(upload_id)
+    open(part_path, 'wb').close()
+    save_json(meta_path, {"filename": filename, "size": int(size), "sha256": checksum, "created": int(time.time())})
+    return jsonify({"upload_id": upload_id, "offset": 0, "chunk_size": UPLOAD_CHUNK_SIZE}), 200
+
+@bp.route('/api/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+@require_auth
+def upload_chunk(upload_id):
+    meta_path, part_path = upload_paths(upload_id)
+    if not meta_path or not os.path.exists(meta_path):
+        return jsonify({"error": "Unknown upload"}), 404
+    meta = load_json(meta_path, {})
+
+    with file_lock(part_path):
+        if request.method == 'DELETE':
+            for path in (part_path, meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return jsonify({"status": "cancelled"}), 200
+
+        offset = part_size(part_path)
+        if request.method == 'GET':
+            return jsonify({"offset": offset, "size": meta['size']}), 200
+
+        start = request.args.get('offset', type=int)
+        if start is None or start < 0 or start > offset:
+            return jsonify({"error": "Offset does not match", "offset": offset}), 409
+        # stream the body to disk in small blocks; nothing larger than one block is held in memory
+        with open(part_path, 'r+b') as f:
+            f.truncate(start)
+            f.seek(start)
+            written = start
+            for block in iter(lambda: request.stream.read(64 * 1024), b''):
+                written += len(block)
+                if written > meta['size']:
+                    f.truncate(start)
+                    return jsonify({"error": "Chunk goes past the declared size", "offset": start}), 400
+                f.write(block)
+        os.utime(meta_path)
+        return jsonify({"offset": written, "size": meta['size']}), 200
+
+@bp.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@require_auth
+def complete_upload(upload_id):
+    meta_path, part_path = upload_paths(upload_id)
+    if not meta_path or not os.path.exists(meta_path):
+        return jsonify({"error": "Unknown upload"}), 404
+    meta = load_json(meta_path, {})
+    with file_lock(part_path):
+        offset = part_size(part_path)
+        if offset != meta['size']:
+            return jsonify({"error": "Upload incomplete", "offset": offset, "size": meta['size']}), 409
+        checksum = str((request.get_json(silent=True) or {}).get('sha256') or meta.get('sha256') or '').lower()
+        if checksum and sha256_file(part_path) != checksum:
+            # the bytes on disk are bad; start over rather than resume onto them
+            open(part_path, 'wb').close()
+            return jsonify({"error": "Checksum mismatch", "offset": 0}), 422
+        response = buffer_upload(os.path.splitext(meta['filename'])[1].lower(),
+                                 lambda dest: os.replace(part_path, dest))
+        if response[1] == 200:
+            os.remove(meta_path)
+        return response
+
+def publishing():
+    # held (shared) from finalizing a product's images until the product is stored. An image
+    # reused from images/ has no owner in between, so perm-delete takes this exclusively
+    # before it removes files nothing refers to, in every server process
+    return process_lock(PUBLISH_LOCK, shared=True)
+
+def build_product(data):
+    # product record from a validated payload; buffer images are finalized on the way
+    raw_id = data["id"].strip()
+    # every upload is checked before any is moved, so a bad one leaves the others in the buffer
+    for path in [data.get("mainImage")] + list(data.get("gallery") or []):
+        check_upload(path)
+    main_img = finalize_filename(data.get("mainImage"))
+    gallery = [finalize_filename(p) for p in data.get("gallery") or []]
+    derivatives = build_derivatives([main_img] + gallery, previous_derivatives(raw_id))
+
+    product = {
+        "id": raw_id,
+        "name": data.get("name"),
+        "category": data.get("category"),
+        "fabric": data.get("fabric"),
+        "color": data.get("color"),
+        "price": data.get("price"),
+        "discount_price": data.get("discount_price"),
+        "desc": data.get("desc"),
+        "stars": int(data.get("stars", 5)),
+        "stock": data.get("stock", "in_stock"),
+        "stock_count": int(validate_number(data.get("stock_count", 0))),
+        "image": main_img,
+        "gallery": gallery,
+        "timestamp": int(time.time())
+    }
+    if derivatives:
+        product["derivatives"] = derivatives
+    return product
+
+@bp.route('/api/save-incomplete', methods=['POST'])
 @require_auth
 def save_incomplete():
     try:
         data = request.json
+        error = validate_product(data, draft=True)
+        if error:
+            return jsonify({"error": error}), 400
         
-        raw_id = data.get("id", "").strip()
-        if not raw_id or not re.match(r'^[a-zA-Z0-9\-_]+$', raw_id):
-            return jsonify({"error": "Invalid product ID"}), 400
-        
-        if not validate_input('name', data.get("name", "")):
-            return jsonify({"error": "Invalid name (max 200 chars)"}), 400
+        with publishing():
+            product = build_product(data)
+            store.upsert('unfilled', product)
+        drafts.drop_product(product["id"])
         
-        if not validate_input('desc', data.get("desc", "")):
-            return jsonify({"error": "Invalid description (max 5000 chars)"}), 400
-        
-        stock_count = validate_number(data.get("stock_count", 0), INPUT_LIMITS['stock_count'])
-        if stock_count is False:
-            return jsonify({"error": "Invalid stock count"}), 400
-        
-        safe_id = "".join([c for c in raw_id if c.isalnum() or c in ('-', '_')])
-        
-        main_img = finalize_filename(data.get("mainImage"), f"{safe_id}_draft_main")
-        gallery = [finalize_filename(p, f"{safe_id}_draft_{i+1}") for i, p in enumerate(data.get("gallery", []))]
-
-        product = {
-            "id": raw_id,
-            "name": data.get("name"),
-            "category": data.get("category"),
-            "fabric": data.get("fabric"),
-            "color": data.get("color"),
-            "price": data.get("price"),
-            "discount_price": data.get("discount_price"),
-            "desc": data.get("desc"),
-            "stars": int(data.get("stars", 5)),
-            "stock": data.get("stock", "in_stock"),
-            "stock_count": int(stock_count),
-            "image": main_img,
-            "gallery": gallery,
-            "timestamp": int(time.time())
-        }
-
-        unfilled_data = load_json(UNFILLED_FILE, [])
-        unfilled_data = [p for p in unfilled_data if p['id'] != raw_id]
-        unfilled_data.append(product)
-        save_json(UNFILLED_FILE, unfilled_data)
-        
-        return jsonify({"status": "success", "id": raw_id}), 200
+        return jsonify({"status": "success", "id": product["id"]}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e: 
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/add-product', methods=['POST'])
+@bp.route('/api/add-product', methods=['POST'])
 @require_auth
 def add_product():
     try:
         data = request.json
+        error = validate_product(data)
+        if error:
+            return jsonify({"error": error}), 400
         
-        raw_id = data.get("id", "").strip()
-        if not raw_id or not re.match(r'^[a-zA-Z0-9\-_]+$', raw_id):
-            return jsonify({"error": "Invalid product ID"}), 400
-        
-        if not validate_input('name', data.get("name", "")):
-            return jsonify({"error": "Invalid name"}), 400
-        
-        if not validate_stock_status(data.get("stock", "in_stock")):
-            return jsonify({"error": "Invalid stock status"}), 400
-        
-        stock_count = validate_number(data.get("stock_count", 0), INPUT_LIMITS['stock_count'])
-        if stock_count is False:
-            return jsonify({"error": "Invalid stock count"}), 400
-        
-        safe_id = "".join([c for c in raw_id if c.isalnum() or c in ('-', '_')])
-        
-        main_img = finalize_filename(data.get("mainImage"), f"{safe_id}_main")
-        gallery = [finalize_filename(p, f"{safe_id}_{i+1}") for i, p in enumerate(data.get("gallery", []))]
-
-        product = {
-            "id": raw_id,
-            "name": data.get("name"),
-            "category": data.get("category"),
-            "fabric": data.get("fabric"),
-            "color": data.get("color"),
-            "price": data.get("price"),
-            "discount_price": data.get("discount_price"),
-            "desc": data.get("desc"),
-            "stars": int(data.get("stars", 5)),
-            "stock": data.get("stock", "in_stock"),
-            "stock_count": int(stock_count),
-            "image": main_img,
-            "gallery": gallery,
-            "timestamp": int(time.time())
-        }
-
-        current_data = load_json(DATA_FILE, [])
-        current_data = [p for p in current_data if p['id'] != raw_id]
-        current_data.append(product)
-        save_json(DATA_FILE, current_data)
-        
-        unfilled_data = load_json(UNFILLED_FILE, [])
-        unfilled_data = [p for p in unfilled_data if p['id'] != raw_id]
-        save_json(UNFILLED_FILE, unfilled_data)
+        with publishing():
+            product = build_product(data)
+            store.upsert('main', product, drop_from='unfilled')
 
-        save_json(DRAFT_FILE, {})
-        return jsonify({"status": "success", "id": raw_id}), 200
+        # only this product's drafts go; other admins keep theirs
+        drafts.drop_product(product["id"])
+        return jsonify({"status": "success", "id": product["id"]}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e: 
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/move-product', methods=['POST'])
+@bp.route('/api/move-product', methods=['POST'])
 @require_auth
 def move_product():
     try:
@@ -382,119 +984,413 @@ def move_product():
         if action not in ['trash', 'restore']:
             return jsonify({"error": "Invalid action"}), 400
         
+        # images stay where they are; only the record changes collection
+        if store.move(pid, 'trash' if action == 'trash' else 'main'):
+            return jsonify({"status": "success"}), 200
         if action == 'trash':
-            main_data = load_json(DATA_FILE, [])
-            unfilled_data = load_json(UNFILLED_FILE, [])
-            trash_data = load_json(TRASH_FILE, [])
-            
-            item = next((p for p in main_data if p['id'] == pid), None)
-            source_list = main_data
-            source_file = DATA_FILE
-            
-            if not item:
-                item = next((p for p in unfilled_data if p['id'] == pid), None)
-                source_list = unfilled_data
-                source_file = UNFILLED_FILE
-            
-            if item:
-                if item.get('image'): 
-                    item['image'] = move_to_trash(item['image'])
-                item['gallery'] = [move_to_trash(g) for g in item.get('gallery', [])]
-                trash_data.append(item)
-                save_json(TRASH_FILE, trash_data)
-                source_list = [p for p in source_list if p['id'] != pid]
-                save_json(source_file, source_list)
-                return jsonify({"status": "success"}), 200
             return jsonify({"status": "error", "message": "Not found"}), 404
-        
-        elif action == 'restore':
-            main_data = load_json(DATA_FILE, [])
-            trash_data = load_json(TRASH_FILE, [])
-            item = next((p for p in trash_data if p['id'] == pid), None)
-            if item:
-                if item.get('image'): 
-                    item['image'] = move_from_trash(item['image'])
-                item['gallery'] = [move_from_trash(g) for g in item.get('gallery', [])]
-                main_data.append(item)
-                save_json(DATA_FILE, main_data)
-                trash_data = [p for p in trash_data if p['id'] != pid]
-                save_json(TRASH_FILE, trash_data)
-                return jsonify({"status": "success"}), 200
-            return jsonify({"status": "error"}), 404
+        return jsonify({"status": "error"}), 404
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/perm-delete', methods=['POST'])
+@bp.route('/api/perm-delete', methods=['POST'])
 @require_auth
 def perm_delete():
     try:
         pid = request.json.get('id')
-        trash_data = load_json(TRASH_FILE, [])
-        item = next((p for p in trash_data if p['id'] == pid), None)
-        if item:
-            if item.get('image'):
-                full_path = os.path.join(BASE_DIR, item['image'])
-                if os.path.exists(full_path): 
-                    os.remove(full_path)
-            for img_path in item.get('gallery', []):
+        with process_lock(PUBLISH_LOCK), store.lock:
+            if store.get('trash', pid) is None:
+                return jsonify({"status": "error", "message": "Not found"}), 404
+            # files shared with other products (in any collection) are kept
+            for img_path in store.perm_delete(pid):
                 full_path = os.path.join(BASE_DIR, img_path)
                 if os.path.exists(full_path): 
                     os.remove(full_path)
-            trash_data = [p for p in trash_data if p['id'] != pid]
-            save_json(TRASH_FILE, trash_data)
-            return jsonify({"status": "success"}), 200
-        return jsonify({"status": "error", "message": "Not found"}), 404
+        return jsonify({"status": "success"}), 200
     except Exception as e: 
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/clear-buffer', methods=['POST'])
+@bp.route('/api/clear-buffer', methods=['POST'])
 @require_auth
 def clear_buffer():
-    try:
-        for f in os.listdir(BUFFER_DIR):
-            try: 
-                os.remove(os.path.join(BUFFER_DIR, f))
-            except: 
-                pass
-        return jsonify({"status": "success"}), 200
-    except: 
-        return jsonify({"status": "error"}), 500
+    # unreferenced buffer files older than GC_GRACE go on the next GC pass, started now
+    image_gc.trigger()
+    return jsonify({"status": "success", "scheduled": True}), 200
 
-@app.route('/api/products', methods=['GET'])
+@bp.route('/api/gc', methods=['GET', 'POST'])
+@require_auth
+def image_gc_status():
+    # GET: last pass and running totals (files, bytes reclaimed); POST: run a pass now
+    if request.method == 'POST':
+        image_gc.trigger()
+        return jsonify({"status": "scheduled"}), 202
+    return jsonify(image_gc.report()), 200
+
+@bp.route('/api/products', methods=['GET'])
 def get_products():
-    source = request.args.get('source', 'main')
-    sort_by = request.args.get('sort', 'newest')
-    
-    if source == 'trash': 
-        data = load_json(TRASH_FILE, [])
-    elif source == 'unfilled': 
-        data = load_json(UNFILLED_FILE, [])
-    else: 
-        data = load_json(DATA_FILE, [])
-    
-    if sort_by == 'newest':
-        data = sorted(data, key=lambda x: x.get('timestamp', 0), reverse=True)
-    elif sort_by == 'oldest':
-        data = sorted(data, key=lambda x: x.get('timestamp', 0))
+    source, sort_by = listing_source(request.args)
+    return cached_listing(source, listing_key(source, sort_by, request.args),
+                          lambda: product_listing(store, source, sort_by, request.args))
+
+def cached_listing(source, key, build):
+    # build() -> (payload, status); serialized (and compressed) once per collection version
+    encoding = request.accept_encodings.best_match(listing_cache.encodings)
+    tag = catalog_etag(source)
+
+    def respond():
+        status, body, used = listing_cache.get(key, tag, lambda: json_body(*build()), encoding)
+        response = current_app.response_class(body, status=status, mimetype='application/json')
+        if used:
+            response.headers['Content-Encoding'] = used
+        return response
+
+    response = conditional_response(f"{tag}-{encoding}" if encoding else tag, store.modified_of(source), respond)
+    response.vary.add('Accept-Encoding')
+    return response
+
+def json_body(payload, status):
+    # (status, bytes jsonify() would send)
+    return status, current_app.json.response(payload).get_data()
+
+# The listing and the delta feed are plain functions of the query string so the ASGI
+# server (asgi.py) answers them the same way without going through Flask.
+def listing_source(args):
+    source = args.get('source', 'main')
+    sort_by = args.get('sort', 'newest')
     
-    return jsonify(data), 200
+    if source not in ['trash', 'unfilled']:
+        source = 'main'
+    if sort_by not in ['newest', 'oldest']:
+        sort_by = None
+    return source, sort_by
+
+def listing_key(source, sort_by, args):
+    # only the parameters that shape the body, so made-up ones do not fill the cache
+    return (source, sort_by) + tuple((k, tuple(args.getlist(k))) for k in QUERY_PARAMS if k in args)
+
+def product_listing(catalog, source, sort_by, args):
+    # (payload, status)
+    if not any(k in args for k in QUERY_PARAMS):
+        return catalog.all(source, sort_by), 200
+
+    # Paged / filtered listing: {"items", "total", "next_cursor", "facets"}
+    try:
+        limit = int(args.get('limit') or PAGE_SIZE)
+        offset = int(args.get('cursor') or 0)
+        min_price = float(args['min_price']) if args.get('min_price') else None
+        max_price = float(args['max_price']) if args.get('max_price') else None
+    except ValueError:
+        return {"error": "Invalid query"}, 400
+    if limit < 1 or offset < 0:
+        return {"error": "Invalid query"}, 400
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    filters = {f: args.getlist(f) for f in FACETS}
+    result = catalog.query(source, sort_by, filters, args.get('q'), min_price, max_price, offset, limit)
+    result['next_cursor'] = str(offset + limit) if offset + limit < result['total'] else None
+    return result, 200
+
+@bp.route('/api/products/changes', methods=['GET'])
+def get_product_changes():
+    return jsonify(product_changes(store, request.args)), 200
+
+def product_changes(catalog, args):
+    # Delta sync: {"version", "full": false, "upserted", "removed"} since a version,
+    # or {"version", "full": true, "products"} when there is no usable delta
+    source = args.get('source', 'main')
+    if source not in ['trash', 'unfilled']:
+        source = 'main'
+    since = args.get('since', '')
+    events, version = catalog.changes_since(int(since)) if since.isdigit() else (None, catalog.current_version())
+
+    latest = {}
+    for e in events or []:
+        if e['collection'] != source:
+            continue
+        if e['id'] is None:
+            events = None  # the collection was reloaded from disk
+            break
+        latest[e['id']] = e.get('product')
+    if events is None:
+        return {"version": version, "full": True, "products": catalog.all(source, 'newest')}
+
+    upserted = [p for p in latest.values() if p is not None]
+    removed = [pid for pid, p in latest.items() if p is None]
+    return {"version": version, "full": False, "upserted": upserted, "removed": removed}
+
+# --- BULK OPERATIONS ---
+# POST /api/bulk {"ops": [{"op": "upsert", "collection": "main" | "unfilled", "product": {...}},
+#                        {"op": "trash", "id": ...}, {"op": "restore", "id": ...}]}
+# Every row is validated like the single-item routes; the valid ones are committed together
+# (one journal write / one transaction) and the rest come back as {"index", "id", "error"}.
+def run_bulk(rows):
+    # rows: (index, row) pairs; errors carry the index, which is the row's place in the request
+    with publishing():
+        return _run_bulk(rows)
+
+def _run_bulk(rows):
+    errors, prepared = [], []
+    for i, row in rows:
+        if not isinstance(row, dict):
+            errors.append({"index": i, "id": None, "error": "Invalid row"})
+            continue
+        op = row.get('op', 'upsert')
+        data = row.get('product') if op == 'upsert' else None
+        pid = None
+        try:
+            if op == 'upsert':
+                name = row.get('collection', 'main')
+                if name not in ('main', 'unfilled'):
+                    raise ValueError("Invalid collection")
+                if not isinstance(data, dict):
+                    raise ValueError("Missing product")
+                pid = data.get('id')
+                error = validate_product(data, draft=name == 'unfilled')
+                if error:
+                    raise ValueError(error)
+                prepared.append((i, op, name, build_product(data)))
+            elif op in ('trash', 'restore'):
+                pid = row.get('id')
+                if not isinstance(pid, str) or not pid:
+                    raise ValueError("Invalid product ID")
+                prepared.append((i, op, None, pid))
+            else:
+                raise ValueError("Invalid op")
+        except Exception as e:
+            errors.append({"index": i, "id": pid, "error": str(e)})
+
+    entries = []
+    with store.lock:
+        # later rows see what earlier rows in the batch did to the same id
+        pending = {}
+        def locate(pid, names):
+            if pid in pending:
+                return pending[pid] if pending[pid][0] in names else (None, None)
+            return store.find(pid, names)
+
+        for i, op, name, value in prepared:
+            if op == 'upsert':
+                entry = {"op": "upsert", "col": name, "product": value}
+                if name == 'main':
+                    entry["from"] = 'unfilled'
+                pending[value['id']] = (name, value)
+            else:
+                source, item = locate(value, ['main', 'unfilled'] if op == 'trash' else ['trash'])
+                if item is None:
+                    errors.append({"index": i, "id": value, "error": "Not found"})
+                    continue
+                entry = {"op": "trash", "from": source, "product": item} if op == 'trash' else {"op": "restore", "product": item}
+                pending[value] = ('trash' if op == 'trash' else 'main', item)
+            entries.append(entry)
+        if entries:
+            store.commit_batch(entries)
+    return len(entries), sorted(errors, key=lambda e: e["index"])
+
+@bp.route('/api/bulk', methods=['POST'])
+@require_auth
+def bulk_operations():
+    rows = (request.get_json(silent=True) or {}).get('ops')
+    if not isinstance(rows, list):
+        return jsonify({"error": "Expected {\"ops\": [...]}"}), 400
+    if len(rows) > BULK_MAX_ROWS:
+        return jsonify({"error": f"Too many rows (max {BULK_MAX_ROWS})"}), 400
+    try:
+        applied, errors = run_bulk(list(enumerate(rows)))
+        return jsonify({"status": "success", "applied": applied, "errors": errors}), 200
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def read_jsonl(text):
+    for line in text:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+
+def read_rows(rows):
+    # a row the reader cannot get through (bad CSV, bad UTF-8) ends the import as an error row
+    try:
+        yield from rows
+    except (csv.Error, ValueError) as e:
+        yield e
+
+def csv_product(row):
+    product = {k: v for k, v in row.items() if k in BULK_FIELDS and v not in (None, '')}
+    product['mainImage'] = product.pop('image', '')
+    product['gallery'] = [g for g in product.get('gallery', '').split('|') if g]
+    return product
+
+@bp.route('/api/bulk/import', methods=['POST'])
+@require_auth
+def bulk_import():
+    # body is CSV (BULK_FIELDS header, gallery joined with |) or JSONL (one product per line),
+    # read as a stream and committed every BULK_BATCH_SIZE rows
+    fmt = request.args.get('format', 'jsonl')
+    collection = request.args.get('collection', 'main')
+    if fmt not in ('csv', 'jsonl') or collection not in ('main', 'unfilled'):
+        return jsonify({"error": "Invalid format or collection"}), 400
+    text = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        products = read_rows(csv_product(row) for row in csv.DictReader(text))
+    else:
+        products = read_rows(read_jsonl(text))
+    applied, errors, batch = 0, [], []
+    for index, product in enumerate(products):
+        if isinstance(product, Exception):
+            errors.append({"index": index, "id": None, "error": f"Unreadable row: {product}"})
+            continue
+        if isinstance(product, dict) and 'mainImage' not in product and 'image' in product:
+            product = dict(product, mainImage=product['image'])
+        batch.append((index, {"op": "upsert", "collection": collection, "product": product}))
+        if len(batch) >= BULK_BATCH_SIZE:
+            done, failed = run_bulk(batch)
+            applied, errors, batch = applied + done, errors + failed, []
+    if batch:
+        done, failed = run_bulk(batch)
+        applied, errors = applied + done, errors + failed
+    errors.sort(key=lambda e: e["index"])
+    return jsonify({"status": "success", "applied": applied, "errors": errors}), 200
 
-@app.route('/api/get-next-id', methods=['GET'])
+@bp.route('/api/bulk/export', methods=['GET'])
+@require_auth
+def bulk_export():
+    fmt = request.args.get('format', 'jsonl')
+    source = request.args.get('source', 'main')
+    if fmt not in ('csv', 'jsonl') or source not in ('main', 'unfilled', 'trash'):
+        return jsonify({"error": "Invalid format or source"}), 400
+    products = store.all(source)
+
+    def stream():
+        if fmt == 'jsonl':
+            for p in products:
+                yield json.dumps(p, ensure_ascii=False) + '\n'
+            return
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=BULK_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for p in products:
+            writer.writerow(dict(p, gallery='|'.join(p.get('gallery') or [])))
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        yield buf.getvalue()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return current_app.response_class(stream(), mimetype=mimetype,
+                              headers={'Content-Disposition': f'attachment; filename={source}.{fmt}'})
+
+@bp.route('/api/get-next-id', methods=['POST'])
+@require_auth
 def get_next_id():
-    data = load_json(DATA_FILE, []) + load_json(TRASH_FILE, []) + load_json(UNFILLED_FILE, [])
-    max_num = 100
-    for item in data:
-        match = re.search(r'\d+', str(item.get('id', '')))
-        if match:
-            num = int(match.group())
-            if num > max_num: 
-                max_num = num
-    return jsonify({"next_id": f"DS-{max_num + 1}"}), 200
+    # hands out (and uses up) an id, so it is an authenticated POST like the other writes
+    return jsonify({"next_id": store.allocate_id()}), 200
 
 def open_browser():
     time.sleep(2)
     webbrowser.open(f"http://localhost:{PORT}/admin.html")
 
+def export_site(out_dir, full=False):
+    from export import build_site
+    with create_app().app_context():
+        result = build_site(store.all('main'), out_dir, BASE_DIR, full=full)
+    print(f"[*] Exported to {out_dir}: {len(result['written'])} pages written, {result['skipped']} unchanged, "
+          f"{len(result['removed'])} removed, {result['copied']} files copied")
+    return result
+
+def serve(host, port, workers, threads, reload=False, asgi=False):
+    # production server: gunicorn (one process per worker, each with its own copy of the
+    # catalog kept in step through the journal), or waitress where gunicorn is unavailable
+    if asgi:
+        return serve_asgi(host, port, workers, threads, reload)
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        try:
+            from waitress import serve as waitress_serve
+        except ImportError:
+            sys.exit("[!] `serve` needs gunicorn (Linux/macOS) or waitress (Windows): pip install gunicorn")
+        if workers > 1:
+            print("[!] waitress runs a single process; ignoring --workers, use --threads")
+        print(f"[*] Serving on http://{host}:{port} with waitress ({threads} threads)")
+        waitress_serve(create_app(), host=host, port=port, threads=threads)
+        return
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('timeout', 120)          # large uploads
+            self.cfg.set('graceful_timeout', 30)  # SIGHUP / SIGTERM let requests in flight finish
+            self.cfg.set('reload', reload)
+
+        def load(self):
+            # built in each worker after the fork, so every worker opens its own store
+            import backend
+            return backend.create_app()
+
+    metrics_dir = None
+    if workers > 1 and not REGISTRY.directory:
+        # workers share their metrics through snapshot files, so any of them can answer /metrics
+        metrics_dir = REGISTRY.directory = tempfile.mkdtemp(prefix='dashami-metrics-')
+    master = os.getpid()
+    print(f"[*] Serving on http://{host}:{port} with gunicorn ({workers} workers x {threads} threads), "
+          f"pid {os.getpid()}; kill -HUP {os.getpid()} reloads workers gracefully")
+    try:
+        Server().run()
+    finally:
+        # workers leave run() through SystemExit too; only the arbiter cleans up
+        if metrics_dir and os.getpid() == master:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+def serve_asgi(host, port, workers, threads, reload=False):
+    # uvicorn in front of asgi.py: storefront reads and change feeds on an event loop,
+    # `threads` sizes each worker's pool for file/catalog work and for the Flask routes
+    try:
+        import uvicorn
+        import a2wsgi
+    except ImportError:
+        sys.exit("[!] `serve --asgi` needs uvicorn and a2wsgi: pip install uvicorn a2wsgi")
+    # worker processes are spawned, not forked: they get their settings from the environment
+    os.environ['DASHAMI_THREADS'] = str(threads)
+    metrics_dir = None
+    if workers > 1 and not REGISTRY.directory:
+        metrics_dir = os.environ['DASHAMI_METRICS_DIR'] = tempfile.mkdtemp(prefix='dashami-metrics-')
+    print(f"[*] Serving on http://{host}:{port} with uvicorn ({workers} workers, {threads} threads each), "
+          f"pid {os.getpid()}")
+    try:
+        uvicorn.run('asgi:app', host=host, port=port, workers=workers, app_dir=BASE_DIR, access_log=False,
+                    reload=reload, reload_dirs=[BASE_DIR] if reload else None, timeout_graceful_shutdown=30)
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+if __name__ == '__main__' and sys.argv[1:2] == ['serve']:
+    import argparse
+    parser = argparse.ArgumentParser(prog='backend.py serve', description='Run the production server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('DASHAMI_WORKERS', 2)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('DASHAMI_THREADS', 8)),
+                        help='threads per worker; without --asgi every open admin change feed holds one')
+    parser.add_argument('--reload', action='store_true', help='restart workers when the code changes')
+    parser.add_argument('--asgi', action='store_true',
+                        help='serve with uvicorn (asgi.py): slow clients and change feeds do not hold threads')
+    args = parser.parse_args(sys.argv[2:])
+    serve(args.host, args.port, args.workers, args.threads, args.reload, args.asgi)
+    sys.exit(0)
+
+if __name__ == '__main__' and len(sys.argv) > 1 and sys.argv[1] == 'export':
+    import argparse
+    parser = argparse.ArgumentParser(prog='backend.py export', description='Write the pre-rendered storefront')
+    parser.add_argument('--out', default=EXPORT_DIR, help='output directory')
+    parser.add_argument('--full', action='store_true', help='rebuild every page, not just changed ones')
+    args = parser.parse_args(sys.argv[2:])
+    export_site(os.path.abspath(args.out), full=args.full)
+    sys.exit(0)
+
 if __name__ == '__main__':
     local_ip = get_local_ip()
     print(f"\n{'='*60}")
@@ -504,4 +1400,4 @@ if __name__ == '__main__':
     print(f" API Key: {ADMIN_API_KEY}")
     print(f"{'='*60}\n")
     threading.Thread(target=open_browser, daemon=True).start()
-    app.run(host='0.0.0.0', port=PORT, debug=False)
+    create_app().run(host='0.0.0.0', port=PORT, debug=False)
@@ -0,0 +1,518 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import threading
+import platform
+import statistics
+import argparse
+import tempfile
+import subprocess
+import http.client
+import multiprocessing
+
+# Benchmarks run against a scratch copy of this folder (code only, empty catalog) so the
+# real data files are never touched. Each scenario runs in its own process:
+#   python bench.py bulk --count 200 [--storage json|sqlite]
+#   python bench.py serve --workers 1,2,4 [--duration 5 --clients 8 --count 1000]
+#   python bench.py serve --servers threaded,async --workers 1 --feeds 0,16,64 [--slow 16]
+#   python bench.py startup [--count 1000]      fails when over STARTUP_BUDGET_MS
+#   python bench.py api --sizes 1000,10000,100000 --versions v1,v2 [--out results.json]
+#   python bench.py compare before.json after.json
+#   python bench.py memory --sizes 1000,10000,100000
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_FILES = ['backend.py', 'asgi.py', 'storage.py', 'product.py', 'static_files.py', 'metrics.py', 'image_gc.py',
+              'drafts.py', 'listing_cache.py', 'export.py', 'bench.py', 'main.html', 'admin.html']
+V1_DIR = os.path.join(os.path.dirname(BASE_DIR), 'dashami_silks_v1')
+
+def sample_product(i):
+    return {"id": f"DS-{1000 + i}", "name": f"Bench Saree {i}", "category": ["Silk", "Cotton", "Georgette"][i % 3],
+            "fabric": "Silk", "color": "Red", "price": str(1000 + i), "discount_price": "", "desc": "Benchmark item",
+            "stars": 5, "stock": "in_stock", "stock_count": 3}
+
+def scratch_copy(src=BASE_DIR, files=CODE_FILES):
+    # bench.py itself always comes from here, so it can drive the v1 backend too
+    folder = tempfile.mkdtemp(prefix='dashami-bench-')
+    for name in files:
+        if os.path.exists(os.path.join(src, name)):
+            shutil.copy2(os.path.join(src, name), folder)
+    shutil.copy2(os.path.join(BASE_DIR, 'bench.py'), folder)
+    return folder
+
+def run_isolated(scenario, mode, count, storage):
+    folder = scratch_copy()
+    try:
+        env = dict(os.environ, DASHAMI_STORAGE=storage)
+        out = subprocess.run([sys.executable, os.path.join(folder, 'bench.py'), '_run', scenario, mode, str(count)],
+                             cwd=folder, env=env, capture_output=True, text=True, check=True).stdout
+        return json.loads(out.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# --- SCENARIOS (run inside the scratch copy) ---
+def bulk_scenario(mode, count):
+    import backend
+    app = backend.create_app()
+    app.app_context().push()
+    client = app.test_client()
+    headers = {'X-API-Key': app.config['ADMIN_API_KEY']}
+    products = [sample_product(i) for i in range(count)]
+    start = time.perf_counter()
+    if mode == 'item':
+        for product in products:
+            assert client.post('/api/add-product', json=product, headers=headers).status_code == 200
+    else:
+        ops = [{"op": "upsert", "product": p} for p in products]
+        assert client.post('/api/bulk', json={"ops": ops}, headers=headers).json['applied'] == count
+    elapsed = time.perf_counter() - start
+    assert len(backend.store.all('main')) == count
+    return {"scenario": "bulk", "mode": mode, "count": count, "storage": app.config['STORAGE_BACKEND'],
+            "seconds": round(elapsed, 4), "ms_per_item": round(elapsed * 1000 / count, 3)}
+
+# import + create_app() must stay cheap (worker boot, test collection); the catalog is
+# opened by the first request instead
+STARTUP_BUDGET_MS = {'import': 400, 'create_app': 50, 'first_request': 500}
+
+def startup_scenario(mode, count):
+    if count:
+        with open('data.json', 'w') as f:
+            json.dump([dict(sample_product(i), timestamp=i, image="", gallery=[]) for i in range(count)], f)
+    start = time.perf_counter()
+    import backend
+    imported = time.perf_counter()
+    app = backend.create_app()
+    created = time.perf_counter()
+    response = app.test_client().get('/api/products?limit=50')
+    first = time.perf_counter()
+    assert response.status_code == 200
+    app.test_client().get('/api/products?limit=50')
+    second = time.perf_counter()
+    return {"scenario": "startup", "mode": mode, "count": count, "storage": app.config['STORAGE_BACKEND'],
+            "modules": sorted(m for m in ('PIL', 'PIL.Image') if m in sys.modules),
+            "import": round((imported - start) * 1000, 1), "create_app": round((created - imported) * 1000, 1),
+            "first_request": round((first - created) * 1000, 1), "next_request": round((second - first) * 1000, 1)}
+
+SCENARIOS = {'bulk': (bulk_scenario, ['item', 'batch']), 'startup': (startup_scenario, ['cold'])}
+
+# --- API SUITE (v1 and v2 through the Flask test client) ---
+# Each (version, catalog size) runs in a fresh scratch copy of that version's folder with a
+# synthetic catalog: `size` products in main, a few in trash, all pointing at a pool of real
+# JPEGs (v2 also gets their WebP derivatives, as published products have). Timings are
+# per request, in ms; sizes of 100k take a few minutes, mostly writing the catalog.
+API_VERSIONS = {
+    'v1': {"src": V1_DIR, "files": ['backend.py'],
+           "trash": ('/api/delete-product', {}), "restore": ('/api/restore-product', {}), "paged": False,
+           "next_id": 'GET'},
+    'v2': {"src": BASE_DIR, "files": CODE_FILES,
+           "trash": ('/api/move-product', {"action": "trash"}), "restore": ('/api/move-product', {"action": "restore"}),
+           "paged": True, "next_id": 'POST'},
+}
+API_SORTS = ['newest', 'oldest', 'none']   # v1 has no sort parameter and always sends file order
+IMAGE_POOL = 16
+TRASH_COUNT = 10
+
+def default_repeat(size):
+    return max(3, min(30, 300000 // size))
+
+def summarize(samples):
+    ms = sorted(s * 1000 for s in samples)
+    return {"n": len(ms), "min_ms": round(ms[0], 3), "median_ms": round(statistics.median(ms), 3),
+            "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3), "mean_ms": round(statistics.fmean(ms), 3)}
+
+def timed(fn, repeat, setup=None):
+    samples = []
+    for i in range(repeat):
+        args = setup(i) if setup else ()
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def jpeg_bytes(size=(1600, 1200), color=(128, 0, 0)):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, 'JPEG', quality=85)
+    return buf.getvalue()
+
+def write_image_pool(version, backend):
+    # [(path, derivatives or None)] written into images/
+    import hashlib
+    os.makedirs('images', exist_ok=True)
+    pool = []
+    for k in range(IMAGE_POOL):
+        data = jpeg_bytes((1200, 900), (40 + k * 12, 20, 60))
+        name = (hashlib.sha256(data).hexdigest()[:32] if version == 'v2' else f"bench_{k}") + '.jpg'
+        with open(os.path.join('images', name), 'wb') as f:
+            f.write(data)
+        path = f"images/{name}"
+        pool.append((path, backend.make_derivatives(path) if version == 'v2' else None))
+    return pool
+
+def synthetic_catalog(version, size, pool):
+    products = []
+    for i in range(size + TRASH_COUNT):
+        (image, image_d), (extra, extra_d) = pool[i % len(pool)], pool[(i + 1) % len(pool)]
+        product = dict(sample_product(i), visible=True, image=image, gallery=[extra], timestamp=1700000000 + i)
+        if version == 'v2':
+            product["derivatives"] = {p: d for p, d in ((image, image_d), (extra, extra_d)) if d}
+        products.append(product)
+    return products[:size], products[size:]
+
+def api_scenario(version, size, repeat):
+    import backend
+    spec = API_VERSIONS[version]
+    if version == 'v2':
+        import storage
+        app = backend.create_app()
+        app.app_context().push()
+        load_json, save = storage.load_json, lambda data: storage.save_json(backend.DATA_FILE, data, backend.BACKUP_FILE)
+    else:
+        app = backend.app
+        load_json, save = backend.load_json, lambda data: backend.save_json(backend.DATA_FILE, data)
+    client = app.test_client()
+    headers = {'X-API-Key': backend.ADMIN_API_KEY} if version == 'v2' else {}
+
+    started = time.perf_counter()
+    main, trash = synthetic_catalog(version, size, write_image_pool(version, backend))
+    for path, data in ((backend.DATA_FILE, main), (backend.TRASH_FILE, trash)):
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=4)
+    results = {"setup_s": round(time.perf_counter() - started, 2),
+               "catalog_bytes": os.path.getsize(backend.DATA_FILE)}
+
+    def call(method, url, **kwargs):
+        response = client.open(url, method=method, headers=headers, **kwargs)
+        assert response.status_code in (200, 304), (url, response.status_code, response.get_data(as_text=True)[:200])
+        return response
+
+    # raw file helpers first: once the v2 store is open, a rewrite of data.json reads as a hand edit
+    ops = {}
+    ops["load_json"] = timed(lambda: load_json(backend.DATA_FILE, []), repeat)
+    ops["save_json"] = timed(lambda: save(main), repeat)
+    call('GET', '/api/products?limit=1')   # opens the v2 store, builds its indexes
+
+    for sort in API_SORTS:
+        ops[f"products:{sort}"] = timed(lambda: call('GET', f'/api/products?sort={sort}'), repeat)
+    if spec["paged"]:
+        ops["products:page"] = timed(lambda: call('GET', '/api/products?limit=50&sort=newest'), repeat)
+        etag = call('GET', '/api/products?sort=newest').headers.get('ETag')
+        ops["products:304"] = timed(lambda: call('GET', '/api/products?sort=newest', environ_overrides={'HTTP_IF_NONE_MATCH': etag}), repeat)
+
+    first_new = size + TRASH_COUNT
+    ops["add-product"] = timed(lambda p: call('POST', '/api/add-product', json=p), repeat,
+                               setup=lambda i: (dict(sample_product(first_new + i), mainImage=main[i % len(main)]["image"], gallery=[]),))
+    (trash_url, trash_extra), (restore_url, restore_extra) = spec["trash"], spec["restore"]
+    ops["trash"] = timed(lambda pid: call('POST', trash_url, json=dict(trash_extra, id=pid)), repeat,
+                         setup=lambda i: (main[i]["id"],))
+    ops["restore"] = timed(lambda pid: call('POST', restore_url, json=dict(restore_extra, id=pid)), repeat,
+                           setup=lambda i: (main[i]["id"],))
+    ops["get-next-id"] = timed(lambda: call(spec["next_id"], '/api/get-next-id'), repeat)
+
+    photo = jpeg_bytes()
+    upload = lambda: call('POST', '/api/upload', data={'file': (io.BytesIO(photo), 'photo.jpg')},
+                          content_type='multipart/form-data')
+    ops["upload"] = timed(upload, repeat)
+    if version == 'v2':
+        # v2 answers before the image is re-encoded; this includes waiting for the worker
+        ops["upload+processed"] = timed(lambda: backend.wait_for_image(upload().json['url']), repeat)
+
+    return dict(results, version=version, size=size, repeat=repeat,
+                storage=app.config.get('STORAGE_BACKEND', 'json') if version == 'v2' else 'json', ops=ops)
+
+def run_api(version, size, repeat, storage):
+    spec = API_VERSIONS[version]
+    folder = scratch_copy(spec["src"], spec["files"])
+    try:
+        env = dict(os.environ, DASHAMI_STORAGE=storage)
+        proc = subprocess.run([sys.executable, os.path.join(folder, 'bench.py'), '_api', version, str(size), str(repeat)],
+                              cwd=folder, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{version} @ {size} failed:\n{proc.stderr[-2000:]}")
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+def run_meta():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "time": time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def print_api(result):
+    print(f"\n{result['version']} {result['storage']} {result['size']} products "
+          f"({result['catalog_bytes'] / 1e6:.1f} MB, setup {result['setup_s']}s, {result['repeat']} runs)")
+    for op, stats in result["ops"].items():
+        print(f"  {op:<18} median {stats['median_ms']:>9.2f} ms   p95 {stats['p95_ms']:>9.2f} ms")
+
+def compare(before_path, after_path):
+    # median of every (version, storage, size, op) in both files, and after/before
+    def medians(path):
+        with open(path) as f:
+            doc = json.load(f)
+        return doc.get("meta", {}), {(r["version"], r["storage"], r["size"], op): s["median_ms"]
+                                     for r in doc["results"] for op, s in r["ops"].items()}
+    (meta_a, a), (meta_b, b) = medians(before_path), medians(after_path)
+    print(f"before {meta_a.get('commit')}  after {meta_b.get('commit')}")
+    for key in sorted(set(a) & set(b), key=str):
+        ratio = b[key] / a[key] if a[key] else float('inf')
+        print(f"  {key[0]} {key[1]:>6} {key[2]:>7} {key[3]:<18} {a[key]:>9.2f} -> {b[key]:>9.2f} ms  x{ratio:.2f}")
+
+# --- MEMORY (product dicts vs Product records) ---
+# How the JSON store's in-memory catalog costs with each product as a dict (as parsed) and
+# as a Product record (product.py). Each (mode, size) runs in a fresh process: the catalog
+# is parsed from JSON like data.json and kept as {id: product}. Reported: bytes held
+# (tracemalloc), objects the cyclic GC has to walk, one full collection with the catalog
+# alive, and parse and serialize times. Serializing records goes through to_dict() and
+# must give the same JSON text as the dicts.
+MEMORY_MODES = ['dict', 'record']
+
+def memory_catalog(size):
+    # published products as build_product() writes them, with their derivatives
+    products = []
+    for i in range(size):
+        image, extra = (f"images/{(i * 2 + k) * 2654435761 % 16 ** 32:032x}.jpg" for k in range(2))
+        derivatives = {path: dict({str(w): path[:-4] + f"_w{w}.webp" for w in (320, 640, 1280)},
+                                  placeholder="data:image/webp;base64,UklGRkAAAABXRUJQVlA4IDQAAACwAgCdASoQAA")
+                       for path in (image, extra)}
+        product = dict(sample_product(i), color=["Red", "Maroon", "Green", "Gold"][i % 4],
+                       image=image, gallery=[extra], timestamp=1700000000 + i, derivatives=derivatives)
+        products.append(product)
+    return json.dumps(products)
+
+def memory_scenario(mode, size):
+    import gc
+    import tracemalloc
+    from product import Product
+    text = memory_catalog(size)
+
+    def load():
+        items = json.loads(text)
+        if mode == 'record':
+            return {p['id']: Product.from_dict(p) for p in items}
+        return {p['id']: p for p in items}
+
+    start = time.perf_counter()
+    held = load()
+    load_s = time.perf_counter() - start
+    del held
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    held = load()
+    gc.collect()
+    held_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    start = time.perf_counter()
+    gc.collect()
+    gc_s = time.perf_counter() - start
+    start = time.perf_counter()
+    body = json.dumps([p.to_dict() for p in held.values()] if mode == 'record' else list(held.values()))
+    dump_s = time.perf_counter() - start
+    return {"scenario": "memory", "mode": mode, "size": size, "bytes": held_bytes,
+            "bytes_per_product": round(held_bytes / size), "gc_objects": len(gc.get_objects()),
+            "gc_ms": round(gc_s * 1000, 1), "load_ms": round(load_s * 1000, 1), "dump_ms": round(dump_s * 1000, 1),
+            "same_json": body == text}
+
+def run_memory(mode, size):
+    proc = subprocess.run([sys.executable, os.path.join(BASE_DIR, 'bench.py'), '_memory', mode, str(size)],
+                          cwd=BASE_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"memory {mode} @ {size} failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+# --- LOAD TEST (`backend.py serve`: threaded gunicorn, or uvicorn with --asgi) ---
+# `clients` processes read the storefront endpoints as fast as they can while the bench
+# also holds `feeds` change feeds open (an admin tab each) and `slow` connections that
+# download data.json at SLOW_READ_RATE (a phone on a bad network). Under gunicorn each of
+# those holds a worker thread for as long as it lasts; once they outnumber workers x
+# threads the fast clients queue up and time out. The async server keeps answering.
+LOAD_PATHS = ['/api/products?limit=50&sort=newest', '/api/products?limit=50&category=Silk', '/data.json']
+LOAD_SERVERS = {'threaded': [], 'async': ['--asgi']}
+LOAD_TIMEOUT = 5
+SLOW_READ_RATE = 16 * 1024      # bytes per second per slow connection
+SLOW_RCVBUF = 4096              # small receive window, so the server cannot push the whole body at once
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/check-updates')
+            conn.getresponse().read()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def load_client(args):
+    # one keep-alive connection hammering the read endpoints; (completed, failed, latencies)
+    port, duration = args
+    conn, done, errors, latencies = None, 0, 0, []
+    i, deadline = 0, time.time() + duration
+    while time.time() < deadline:
+        path, i = LOAD_PATHS[i % len(LOAD_PATHS)], i + 1
+        conn = conn or http.client.HTTPConnection('127.0.0.1', port, timeout=LOAD_TIMEOUT)
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status == 200:
+            done += 1
+    return done, errors, latencies
+
+def open_request(port, path, rcvbuf=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.connect(('127.0.0.1', port))
+    sock.sendall(f"GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n".encode())
+    sock.setblocking(False)
+    return sock
+
+def hold_connections(port, feeds, slow, stop):
+    # open change feeds nobody reads, and slow downloads restarted whenever one finishes
+    held = [open_request(port, '/api/events') for _ in range(feeds)]
+    readers = [open_request(port, '/data.json', SLOW_RCVBUF) for _ in range(slow)]
+    tick = 0.1
+    while not stop.wait(tick):
+        for k, sock in enumerate(readers):
+            try:
+                if sock.recv(int(SLOW_READ_RATE * tick)) == b'':
+                    sock.close()
+                    readers[k] = open_request(port, '/data.json', SLOW_RCVBUF)
+            except BlockingIOError:
+                pass
+            except OSError:
+                sock.close()
+                readers[k] = open_request(port, '/data.json', SLOW_RCVBUF)
+    for sock in held + readers:
+        sock.close()
+
+def load_test(workers, duration, clients, count, storage, server='threaded', threads=4, feeds=0, slow=0, port=8765):
+    folder = scratch_copy()
+    with open(os.path.join(folder, 'data.json'), 'w') as f:
+        json.dump([dict(sample_product(i), timestamp=i, image="", gallery=[]) for i in range(count)], f)
+    env = dict(os.environ, DASHAMI_STORAGE=storage)
+    proc = subprocess.Popen([sys.executable, 'backend.py', 'serve', '--host', '127.0.0.1', '--port', str(port),
+                             '--workers', str(workers), '--threads', str(threads)] + LOAD_SERVERS[server],
+                            cwd=folder, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    stop = threading.Event()
+    try:
+        if not wait_for_port(port):
+            raise RuntimeError("server did not start")
+        holder = threading.Thread(target=hold_connections, args=(port, feeds, slow, stop), daemon=True)
+        holder.start()
+        time.sleep(0.5)   # let the held connections reach the server first
+        with multiprocessing.Pool(clients) as pool:
+            runs = pool.map(load_client, [(port, duration)] * clients)
+        stop.set()
+        holder.join(10)
+        total, errors = sum(r[0] for r in runs), sum(r[1] for r in runs)
+        latencies = sorted(x for r in runs for x in r[2]) or [0]
+        return {"scenario": "serve", "server": server, "workers": workers, "threads": threads, "clients": clients,
+                "feeds": feeds, "slow": slow, "count": count, "storage": storage, "requests": total, "errors": errors,
+                "rps": round(total / duration, 1), "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+                "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1),
+                "cpus": os.cpu_count()}
+    finally:
+        stop.set()
+        proc.terminate()
+        proc.wait(30)
+        shutil.rmtree(folder, ignore_errors=True)
+
+def main(argv):
+    if argv[:1] == ['_run']:
+        scenario, mode, count = argv[1], argv[2], int(argv[3])
+        print(json.dumps(SCENARIOS[scenario][0](mode, count)))
+        return
+    if argv[:1] == ['_api']:
+        print(json.dumps(api_scenario(argv[1], int(argv[2]), int(argv[3]))))
+        return
+    if argv[:1] == ['_memory']:
+        print(json.dumps(memory_scenario(argv[1], int(argv[2]))))
+        return
+    if argv[:1] == ['compare']:
+        compare(*argv[1:3])
+        return
+    parser = argparse.ArgumentParser(description='Dashami backend benchmarks')
+    parser.add_argument('scenario', choices=sorted(SCENARIOS) + ['serve', 'api', 'memory'])
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--sizes', default='1000,10000,100000', help='api, memory: catalog sizes')
+    parser.add_argument('--versions', default='v1,v2', help='api: backends to measure')
+    parser.add_argument('--repeat', type=int, help='api: runs per operation (default depends on size)')
+    parser.add_argument('--out', help='api: also write the JSON results to this file')
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--workers', default='1,2,4', help='serve: worker counts to compare')
+    parser.add_argument('--servers', default='threaded', help='serve: threaded (gunicorn) and/or async (uvicorn)')
+    parser.add_argument('--threads', type=int, default=4, help='serve: threads per worker')
+    parser.add_argument('--feeds', default='0', help='serve: open change feeds to hold during the run')
+    parser.add_argument('--slow', type=int, default=0, help='serve: slow data.json downloads to hold')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--clients', type=int, default=8)
+    args = parser.parse_args(argv)
+    if args.scenario == 'serve':
+        results = [load_test(int(w), args.duration, args.clients, args.count, args.storage, server, args.threads,
+                             int(feeds), args.slow)
+                   for server in args.servers.split(',') for w in args.workers.split(',') for feeds in args.feeds.split(',')]
+        for r in results:
+            print(f"serve {r['server']:>8} {r['workers']:>2}x{r['threads']:<2} {r['storage']:>6}  feeds {r['feeds']:>3} "
+                  f"slow {r['slow']:>3}  {r['requests']:>6} requests  {r['rps']:>7.1f} req/s  "
+                  f"p50 {r['p50_ms']:>6.1f} ms  p99 {r['p99_ms']:>7.1f} ms  {r['errors']} timeouts")
+        print(json.dumps(results))
+        return
+    if args.scenario == 'memory':
+        results = []
+        for size in [int(s) for s in args.sizes.split(',')]:
+            runs = {mode: run_memory(mode, size) for mode in MEMORY_MODES}
+            for r in runs.values():
+                print(f"memory {r['size']:>7} products {r['mode']:>6}  {r['bytes'] / 1e6:>8.1f} MB  "
+                      f"{r['bytes_per_product']:>5} B/product  {r['gc_objects']:>8} GC objects  full GC {r['gc_ms']:>6.1f} ms  "
+                      f"load {r['load_ms']:>7.1f} ms  dump {r['dump_ms']:>7.1f} ms  same JSON: {r['same_json']}")
+            print(f"memory {size:>7} products  records hold x{runs['record']['bytes'] / runs['dict']['bytes']:.2f} "
+                  f"of the dicts' memory")
+            results += runs.values()
+        print(json.dumps(results))
+        return
+    if args.scenario == 'api':
+        results = []
+        for size in [int(s) for s in args.sizes.split(',')]:
+            for version in args.versions.split(','):
+                results.append(run_api(version, size, args.repeat or default_repeat(size), args.storage))
+                print_api(results[-1])
+        doc = {"meta": run_meta(), "results": results}
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(doc, f, indent=2)
+        print(json.dumps(doc))
+        return
+    results = [run_isolated(args.scenario, mode, args.count, args.storage) for mode in SCENARIOS[args.scenario][1]]
+    if args.scenario == 'startup':
+        r = results[0]
+        over = [k for k, budget in STARTUP_BUDGET_MS.items() if r[k] > budget]
+        print(f"startup {r['storage']:>6} {r['count']} items  import {r['import']:.0f}ms  create_app {r['create_app']:.1f}ms  "
+              f"first request {r['first_request']:.0f}ms  next {r['next_request']:.1f}ms  "
+              f"Pillow loaded: {'yes' if r['modules'] else 'no'}")
+        print(json.dumps(results))
+        if over:
+            sys.exit(f"[!] over the startup budget: {', '.join(over)}")
+        return
+    for r in results:
+        print(f"{r['scenario']:>6} {r['mode']:>6} {r['storage']:>6}  {r['count']} items  "
+              f"{r['seconds']:.3f}s  ({r['ms_per_item']:.2f} ms/item)")
+    print(json.dumps(results))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,166 @@
+import re
+import time
+import threading
+
+from storage import load_json, save_json, process_lock, file_signature
+
+# Autosaved form drafts, one per key (an admin's browser session, or a product id), in
+# draft.json as {"drafts": {key: {"data": {...}, "updated": ts}}}. A draft.json from the
+# single-draft days (the draft object itself) reads as the draft under DEFAULT_KEY.
+#
+# Changes are queued and written together FLUSH_DELAY seconds after the first one, so a
+# burst of autosaves costs one write. The write re-reads the file under its lock and
+# replays the queued changes on top, so server processes editing different drafts (or
+# different fields of one draft) do not overwrite each other. Reads see the file plus
+# this process's queued changes.
+#
+# Drafts untouched for DRAFT_TTL seconds are abandoned: expire() drops them (the image GC
+# calls it before every pass), so their uploads do not stay out of the GC's reach forever.
+DEFAULT_KEY = 'default'
+FLUSH_DELAY = 1.0
+DRAFT_TTL = 30 * 24 * 3600
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_.:-]{1,100}$')
+
+def valid_key(key):
+    return bool(KEY_PATTERN.match(key or ''))
+
+def merge_patch(target, patch):
+    # RFC 7396: objects merge field by field, null removes a field, anything else replaces
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+def image_paths(value, found):
+    if isinstance(value, str):
+        if value.startswith('images/'):
+            found.add(value)
+    elif isinstance(value, dict):
+        for v in value.values():
+            image_paths(v, found)
+    elif isinstance(value, list):
+        for v in value:
+            image_paths(v, found)
+    return found
+
+class DraftStore:
+    def __init__(self, path, flush_delay=FLUSH_DELAY, ttl=DRAFT_TTL):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self._pending = []        # (op, key, payload, time) not written yet
+        self._timer = None
+        self._disk = {}
+        self._signature = None
+
+    # --- Reads ---
+    def _read(self):
+        signature = file_signature(self.path)
+        if signature != self._signature:
+            raw = load_json(self.path, {})
+            if not isinstance(raw, dict):
+                raw = {}
+            if "drafts" in raw and isinstance(raw["drafts"], dict):
+                self._disk = raw["drafts"]
+            elif raw:
+                updated = signature[1] / 1e9 if signature else time.time()
+                self._disk = {DEFAULT_KEY: {"data": raw, "updated": updated}}
+            else:
+                self._disk = {}
+            self._signature = signature
+        return self._disk
+
+    def _view(self):
+        drafts = dict(self._read())
+        for op in self._pending:
+            self._apply(drafts, *op)
+        return drafts
+
+    def all(self):
+        # {key: {"data", "updated"}}
+        with self.lock:
+            return self._view()
+
+    def get(self, key):
+        with self.lock:
+            return self._view().get(key)
+
+    def files(self):
+        # image paths any draft points at; the image GC keeps these
+        found = set()
+        for draft in self.all().values():
+            image_paths(draft.get("data"), found)
+        return found
+
+    # --- Writes (queued) ---
+    def put(self, key, data):
+        return self._queue('put', key, data)
+
+    def patch(self, key, diff):
+        return self._queue('patch', key, diff)
+
+    def delete(self, key):
+        return self._queue('delete', key, None)
+
+    def drop_product(self, pid):
+        # drafts of a product that was just saved or published; other drafts stay
+        return self._queue('drop-product', None, pid)
+
+    def expire(self):
+        # drops drafts not updated for ttl seconds; returns their keys
+        if not self.ttl:
+            return []
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            stale = [k for k, d in self._view().items() if (d.get("updated") or 0) < cutoff]
+            if stale:
+                self._queue('expire', None, cutoff)
+        return stale
+
+    def _queue(self, op, key, payload):
+        with self.lock:
+            self._pending.append((op, key, payload, time.time()))
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            return self._view().get(key) if key else None
+
+    @staticmethod
+    def _apply(drafts, op, key, payload, when):
+        if op == 'put':
+            drafts[key] = {"data": payload, "updated": when}
+        elif op == 'patch':
+            current = (drafts.get(key) or {}).get("data")
+            drafts[key] = {"data": merge_patch(current, payload), "updated": when}
+        elif op == 'delete':
+            drafts.pop(key, None)
+        elif op == 'drop-product':
+            for k in [k for k, d in drafts.items()
+                      if k == payload or isinstance(d.get("data"), dict) and d["data"].get("id") == payload]:
+                del drafts[k]
+        elif op == 'expire':
+            for k in [k for k, d in drafts.items() if (d.get("updated") or 0) < payload]:
+                del drafts[k]
+
+    def flush(self):
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            with process_lock(self.path):
+                self._signature = None   # another process may have written since our last read
+                drafts = dict(self._read())
+                for op in self._pending:
+                    self._apply(drafts, *op)
+                save_json(self.path, {"drafts": drafts})
+                self._pending = []
+                self._disk, self._signature = drafts, file_signature(self.path)
@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import html
+import shutil
+import hashlib
+from urllib.parse import quote
+
+from storage import load_json, sort_products, image_files
+
+# Pre-rendered storefront. build_site() writes
+#   index.html                  every visible product, newest first
+#   category/<slug>.html        one page per category
+#   products/<id>.html          one page per product
+#   data/<same path>.json       minified product data behind each page
+# and copies the images the pages use. manifest.json remembers a fingerprint of the data
+# behind every page, so the next build only rewrites pages whose products changed.
+MANIFEST = 'manifest.json'
+TEMPLATE_VERSION = 1   # bump when the markup below changes so the next build redoes every page
+SITE_NAME = 'Dashami Silk'
+WHATSAPP_NUMBER = '918904528959'
+CARD_SIZES = '(max-width: 576px) 50vw, (max-width: 992px) 33vw, 25vw'
+ASSETS = ['logo/logo.png', 'logo/logo-circle.png']
+
+STYLE = """:root{--primary:#800000;--bg:#FFF0E6}
+body{margin:0;background:var(--bg);font-family:'Lato',sans-serif;color:#333}
+header{background:var(--primary);color:#fff;padding:14px 24px;display:flex;align-items:center;gap:12px}
+header a{color:#fff;text-decoration:none}
+.logo{width:45px;height:45px;border-radius:50%;border:2px solid #fff;background:#fff;object-fit:cover}
+.brand{font-family:'Berkshire Swash',cursive;font-size:1.6rem}
+nav{padding:12px 24px;display:flex;flex-wrap:wrap;gap:8px}
+nav a{color:var(--primary);border:1px solid var(--primary);border-radius:20px;padding:4px 14px;text-decoration:none}
+main{padding:12px 24px 40px}
+h1{font-family:'Cinzel',serif;color:var(--primary)}
+.grid{display:grid;grid-template-columns:repeat(auto-fill,minmax(220px,1fr));gap:20px}
+.card{background:#fff;border-radius:12px;overflow:hidden;box-shadow:0 4px 12px rgba(0,0,0,.08);color:inherit;text-decoration:none}
+.card img,.hero img{width:100%;aspect-ratio:3/4;object-fit:cover;background-size:cover;display:block}
+.info{padding:12px}
+.cat-fabric{font-size:.75rem;text-transform:uppercase;color:#888}
+.title{font-size:1rem;margin:4px 0}
+.original-price{text-decoration:line-through;color:#999;margin-right:6px}
+.final-price{color:var(--primary);font-weight:700}
+.product{display:grid;grid-template-columns:minmax(0,1fr) minmax(0,1fr);gap:32px}
+.gallery{display:flex;gap:8px;overflow-x:auto;margin-top:8px}
+.gallery img{width:90px;aspect-ratio:3/4;object-fit:cover;border-radius:6px}
+.buy{display:inline-block;background:#25D366;color:#fff;padding:12px 20px;border-radius:8px;text-decoration:none;margin-top:16px}
+@media(max-width:768px){.product{grid-template-columns:1fr}}"""
+
+# --- 1. HELPERS ---
+def minify(data):
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+def fingerprint(data):
+    return hashlib.sha256(f"{TEMPLATE_VERSION}:{minify(data)}".encode()).hexdigest()[:16]
+
+def slugify(text):
+    return re.sub(r'[^a-z0-9]+', '-', str(text).lower()).strip('-') or 'other'
+
+def page_name(pid):
+    return re.sub(r'[^A-Za-z0-9_-]', '-', str(pid))
+
+def write_file(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+# --- 2. TEMPLATES ---
+def esc(value):
+    return html.escape(str(value if value is not None else ''))
+
+def image_tag(product, path, prefix, sizes, eager=False):
+    if not path:
+        return f'<img src="{prefix}logo/logo.png" alt="{esc(product.get("name"))}">'
+    derivative = (product.get('derivatives') or {}).get(path) or {}
+    widths = sorted(int(k) for k in derivative if k.isdigit())
+    attrs = [f'src="{prefix}{esc(path)}"', f'alt="{esc(product.get("name"))}"']
+    if widths:
+        attrs.append('srcset="' + ', '.join(f'{prefix}{esc(derivative[str(w)])} {w}w' for w in widths) + '"')
+        attrs.append(f'sizes="{sizes}"')
+    if derivative.get('placeholder'):
+        attrs.append(f'style="background-image:url({derivative["placeholder"]})"')
+    attrs.append('fetchpriority="high"' if eager else 'loading="lazy"')
+    return '<img ' + ' '.join(attrs) + '>'
+
+def price_html(product):
+    if not product.get('price'):
+        return '<span class="final-price">Ask Price</span>'
+    if product.get('discount_price'):
+        return (f'<span class="original-price">&#8377;{esc(product["price"])}</span>'
+                f'<span class="final-price">&#8377;{esc(product["discount_price"])}</span>')
+    return f'<span class="final-price">&#8377;{esc(product["price"])}</span>'
+
+def render_card(product, prefix, eager=False):
+    return (f'<a class="card" href="{prefix}products/{page_name(product["id"])}.html">'
+            f'{image_tag(product, product.get("image"), prefix, CARD_SIZES, eager)}'
+            f'<div class="info"><div class="cat-fabric">{esc(product.get("category") or "Saree")} | '
+            f'{esc(product.get("fabric") or "Silk")}</div>'
+            f'<h3 class="title">{esc(product.get("name"))}</h3>'
+            f'<div>{price_html(product)}</div></div></a>')
+
+def render_page(title, body, prefix, shard, categories):
+    nav = ''.join(f'<a href="{prefix}category/{slug}.html">{esc(name)}</a>' for slug, name in categories)
+    return (f'<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8">'
+            f'<meta name="viewport" content="width=device-width, initial-scale=1.0">'
+            f'<title>{esc(title)}</title><link rel="icon" type="image/png" href="{prefix}logo/logo-circle.png">'
+            f'<link rel="preload" href="{prefix}{shard}" as="fetch" crossorigin>'
+            f'<style>{STYLE}</style></head><body data-shard="{prefix}{shard}">'
+            f'<header><a href="{prefix}index.html"><img class="logo" src="{prefix}logo/logo-circle.png" alt=""></a>'
+            f'<a class="brand" href="{prefix}index.html">{SITE_NAME}</a></header>'
+            f'<nav>{nav}</nav><main>{body}</main></body></html>')
+
+def render_listing(title, products, prefix, shard, categories):
+    cards = ''.join(render_card(p, prefix, eager=i < 4) for i, p in enumerate(products))
+    return render_page(f"{title} | {SITE_NAME}", f'<h1>{esc(title)}</h1><div class="grid">{cards}</div>',
+                       prefix, shard, categories)
+
+def render_product(product, prefix, shard, categories):
+    gallery = ''.join(image_tag(product, g, prefix, '90px') for g in product.get('gallery') or []
+                      if os.path.splitext(g)[1].lower() not in ('.mp4', '.mov', '.avi'))
+    message = f"Hello {SITE_NAME}, I am interested in:\n*{product.get('name')}*\nID: {product['id']}"
+    stock = 'In Stock' if product.get('stock', 'in_stock') == 'in_stock' else 'Out of Stock'
+    body = (f'<div class="product"><div class="hero">'
+            f'{image_tag(product, product.get("image"), prefix, "(max-width: 768px) 100vw, 50vw", eager=True)}'
+            f'<div class="gallery">{gallery}</div></div><div>'
+            f'<div class="cat-fabric">{esc(product.get("category") or "Saree")} | {esc(product.get("fabric") or "Silk")}</div>'
+            f'<h1>{esc(product.get("name"))}</h1><div>{price_html(product)}</div>'
+            f'<p>Color: {esc(product.get("color") or "Multi")} | {stock}</p>'
+            f'<p>{esc(product.get("desc"))}</p><p>{"&#9733;" * int(product.get("stars") or 5)}</p>'
+            f'<a class="buy" href="https://wa.me/{WHATSAPP_NUMBER}?text={esc(quote(message))}">'
+            f'Buy / Inquire on WhatsApp</a></div></div>')
+    return render_page(f"{product.get('name')} | {SITE_NAME}", body, prefix, shard, categories)
+
+# --- 3. BUILD ---
+def plan_pages(products):
+    # page path -> (data it is built from, render(shard) -> html)
+    by_category = {}
+    for p in products:
+        by_category.setdefault(slugify(p.get('category') or 'Saree'), []).append(p)
+    categories = sorted(((slug, items[0].get('category') or 'Saree') for slug, items in by_category.items()),
+                        key=lambda c: c[1].lower())
+    pages = {'index.html': (products, lambda shard: render_listing("Collection", products, '', shard, categories))}
+    for slug, name in categories:
+        items = by_category[slug]
+        pages[f'category/{slug}.html'] = (items, lambda shard, n=name, i=items: render_listing(n, i, '../', shard, categories))
+    for p in products:
+        pages[f'products/{page_name(p["id"])}.html'] = (p, lambda shard, p=p: render_product(p, '../', shard, categories))
+    # the category nav is on every page, so a new or renamed category redoes them all
+    return {path: ([categories, data], render) for path, (data, render) in pages.items()}
+
+def copy_into(src_root, out_dir, rel_path):
+    src, dest = os.path.join(src_root, rel_path), os.path.join(out_dir, rel_path)
+    if not os.path.exists(src):
+        return False
+    if os.path.exists(dest) and os.path.getmtime(dest) >= os.path.getmtime(src):
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    shutil.copy2(src, dest)
+    return True
+
+def build_site(products, out_dir, src_root, full=False):
+    # returns {"written": [...], "removed": [...], "skipped": n, "copied": n}
+    products = sort_products([p for p in products if p.get('visible', True) is not False], 'newest')
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    previous = {} if full else load_json(manifest_path, {})
+    if not isinstance(previous, dict):
+        previous = {}
+    manifest, written, skipped = {}, [], 0
+
+    for path, (data, render) in plan_pages(products).items():
+        shard = 'data/' + os.path.splitext(path)[0] + '.json'
+        manifest[path] = fingerprint(data)
+        if previous.get(path) == manifest[path] and os.path.exists(os.path.join(out_dir, path)):
+            skipped += 1
+            continue
+        write_file(os.path.join(out_dir, shard), minify(data[1]))
+        write_file(os.path.join(out_dir, path), render(shard))
+        written.append(path)
+
+    removed = [path for path in previous if path not in manifest]
+    for path in removed:
+        remove_file(os.path.join(out_dir, path))
+        remove_file(os.path.join(out_dir, 'data', os.path.splitext(path)[0] + '.json'))
+
+    files = ASSETS + [f for p in products for f in image_files(p)]
+    copied = sum(copy_into(src_root, out_dir, f) for f in dict.fromkeys(files))
+    write_file(manifest_path, json.dumps(manifest, indent=4))
+    return {"written": written, "removed": removed, "skipped": skipped, "copied": copied}
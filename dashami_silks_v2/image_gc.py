@@ -0,0 +1,137 @@
+import os
+import time
+import threading
+
+from storage import load_json, save_json, process_lock
+from metrics import GC_DELETED_FILES, GC_RECLAIMED_BYTES
+
+# Background removal of image files nothing refers to any more:
+#   images/buffer/  uploads that never got published (abandoned or discarded drafts)
+#   images/         content-addressed images and derivatives no product uses
+#   images/trash/   leftovers from before images were content addressed
+# A file stays while a product in any collection or a saved draft points at it (drafts
+# expire, see drafts.py), and for `grace` seconds after it was last written, which covers
+# an upload the admin has not saved into a draft yet. Deletes run in batches on a daemon
+# thread, never inside a request. The state file (gc.json) is shared by the server
+# processes: a pass runs in whichever process is due first, under that file's lock, and
+# records what it reclaimed.
+GC_INTERVAL = 600
+GC_GRACE = 3600
+GC_BATCH_SIZE = 200
+GC_BATCH_PAUSE = 0.05
+SKIP_PREFIXES = ('upload_', 'job_')   # chunked-upload and image-job state, expired by prune_uploads / prune_jobs
+
+class ImageCollector:
+    def __init__(self, base_dir, folders, referenced, state_path,
+                 interval=GC_INTERVAL, grace=GC_GRACE, batch_size=GC_BATCH_SIZE):
+        # folders: paths relative to base_dir; referenced() -> set of relative paths in use
+        self.base_dir = base_dir
+        self.folders = folders
+        self.referenced = referenced
+        self.state_path = state_path
+        self.interval = interval
+        self.grace = grace
+        self.batch_size = max(1, batch_size)
+        self.wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval and self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='image-gc', daemon=True)
+            self._thread.start()
+
+    def trigger(self):
+        # ask for a pass now instead of at the next interval; still honours the grace period
+        if self._thread is None:
+            threading.Thread(target=self._run_logged, args=(True,), name='image-gc', daemon=True).start()
+        else:
+            self.wake.set()
+
+    def report(self):
+        return load_json(self.state_path, {})
+
+    def _loop(self):
+        while True:
+            forced = self.wake.wait(self.interval)
+            self.wake.clear()
+            self._run_logged(forced)
+
+    def _run_logged(self, force):
+        try:
+            self.run(force=force)
+        except Exception as e:
+            print(f"[!] Image GC failed: {e}")
+
+    def run(self, force=False):
+        # one pass, unless another process ran one less than an interval ago; returns its report
+        with process_lock(self.state_path):
+            state = load_json(self.state_path, {})
+            if not isinstance(state, dict):
+                state = {}
+            if not force and time.time() - state.get("last_run", 0) < self.interval:
+                return None
+            result = self._collect()
+            totals = state.get("totals") or {"passes": 0, "files": 0, "bytes": 0}
+            totals = {"passes": totals["passes"] + 1, "files": totals["files"] + result["deleted"],
+                      "bytes": totals["bytes"] + result["bytes"]}
+            save_json(self.state_path, {"last_run": result["finished"], "last": result, "totals": totals})
+        if result["deleted"]:
+            print(f"[gc] removed {result['deleted']} unreferenced files, {result['bytes'] / 1e6:.1f} MB reclaimed")
+        return result
+
+    def _candidates(self, now):
+        young, found = 0, []
+        for folder in self.folders:
+            full_folder = os.path.join(self.base_dir, folder)
+            try:
+                names = os.listdir(full_folder)
+            except OSError:
+                continue
+            for name in names:
+                if name.startswith(SKIP_PREFIXES):
+                    continue
+                try:
+                    st = os.stat(os.path.join(full_folder, name))
+                except OSError:
+                    continue
+                if not os.path.isfile(os.path.join(full_folder, name)):
+                    continue
+                if now - st.st_mtime < self.grace:
+                    young += 1
+                    continue
+                found.append(f"{folder}/{name}")
+        return found, young
+
+    def _collect(self):
+        started = time.time()
+        candidates, young = self._candidates(started)
+        referenced = self.referenced()
+        orphans = [path for path in candidates if path not in referenced]
+        deleted = reclaimed = errors = batches = 0
+        for i in range(0, len(orphans), self.batch_size):
+            if i:
+                time.sleep(GC_BATCH_PAUSE)
+                # a product or draft may have picked a file up since the scan
+                referenced = self.referenced()
+            batches += 1
+            for path in orphans[i:i + self.batch_size]:
+                full_path = os.path.join(self.base_dir, path)
+                try:
+                    st = os.stat(full_path)
+                    if path in referenced or time.time() - st.st_mtime < self.grace:
+                        continue
+                    os.remove(full_path)
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    errors += 1
+                    print(f"[!] Image GC could not remove {path}: {e}")
+                    continue
+                folder = os.path.dirname(path)
+                GC_DELETED_FILES.inc(folder=folder)
+                GC_RECLAIMED_BYTES.inc(st.st_size, folder=folder)
+                deleted += 1
+                reclaimed += st.st_size
+        return {"started": started, "finished": time.time(), "scanned": len(candidates) + young,
+                "kept_young": young, "orphans": len(orphans), "deleted": deleted, "bytes": reclaimed,
+                "batches": batches, "errors": errors}
@@ -0,0 +1,123 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+from static_files import brotli, MIN_COMPRESS_SIZE
+from metrics import LISTING_CACHE_REQUESTS, LISTING_CACHE_DROPPED
+
+# Serialized listing bodies (/api/products, /data.json), built once per catalog version and
+# then served as stored bytes. Keys are (source, sort, query parameters); every entry also
+# carries the tag of its collection's version (backend.catalog_etag), and the first lookup
+# with a newer tag for a collection drops that collection's entries and nothing else, so
+# trashing a product does not throw away the storefront listings. Compressed variants are
+# made on the first request that accepts them and kept with the entry. Entries are evicted
+# least recently used first once the bytes held pass max_bytes; a body bigger than half of
+# that is served but not kept. One thread builds a missing entry, the others wait for it.
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5   # static assets use 11, which takes seconds on a large catalog
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+class Listing:
+    __slots__ = ('source', 'tag', 'body', 'variants')
+
+    def __init__(self, source, tag, body):
+        self.source = source
+        self.tag = tag
+        self.body = body
+        self.variants = {}   # encoding -> bytes
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(v) for v in self.variants.values())
+
+class ListingCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.size = 0
+        self._entries = OrderedDict()   # key -> Listing, least recently used first
+        self._tags = {}                 # source -> tag its entries were built at
+        self._building = {}             # key -> lock held while one thread builds it
+
+    @property
+    def encodings(self):
+        return ['br', 'gzip'] if brotli else ['gzip']
+
+    def get(self, key, tag, build, encoding=None):
+        # (status, body, content encoding or None); build() -> (status, body bytes) on a miss,
+        # and only 200s are kept
+        if not self.max_bytes:
+            return build() + (None,)
+        entry = self._lookup(key, tag)
+        if entry is None:
+            with self.lock:
+                building = self._building.setdefault(key, threading.Lock())
+            try:
+                with building:
+                    entry = self._lookup(key, tag, count=False)
+                    if entry is None:
+                        LISTING_CACHE_REQUESTS.inc(result='miss')
+                        status, body = build()
+                        if status != 200:
+                            return status, body, None
+                        entry = self._store(key, Listing(key[0], tag, body))
+            finally:
+                with self.lock:
+                    if self._building.get(key) is building:
+                        del self._building[key]
+        if not encoding or len(entry.body) < MIN_COMPRESS_SIZE:
+            return 200, entry.body, None
+        data = entry.variants.get(encoding)
+        if data is None:
+            data = compress(entry.body, encoding)
+            with self.lock:
+                if self._entries.get(key) is entry and encoding not in entry.variants:
+                    entry.variants[encoding] = data
+                    self.size += len(data)
+                    self._evict()
+        return 200, data, encoding
+
+    def _lookup(self, key, tag, count=True):
+        with self.lock:
+            source = key[0]
+            if self._tags.get(source) != tag:
+                self._invalidate(source)
+                self._tags[source] = tag
+            entry = self._entries.get(key)
+            if entry is None or entry.tag != tag:
+                return None
+            self._entries.move_to_end(key)
+        if count:
+            LISTING_CACHE_REQUESTS.inc(result='hit')
+        return entry
+
+    def _store(self, key, entry):
+        # kept only if no newer version of the collection turned up while it was built
+        with self.lock:
+            if self._tags.get(entry.source) != entry.tag or entry.size > self.max_bytes // 2:
+                return entry
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            self._entries[key] = entry
+            self.size += entry.size
+            self._evict()
+        return entry
+
+    def _invalidate(self, source):
+        stale = [k for k, e in self._entries.items() if e.source == source]
+        for k in stale:
+            self.size -= self._entries.pop(k).size
+        if stale:
+            LISTING_CACHE_DROPPED.inc(len(stale), reason='stale')
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+            LISTING_CACHE_DROPPED.inc(reason='evicted')
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import bisect
+import threading
+import contextlib
+
+# Counters and histograms kept in memory and rendered in the Prometheus text format at
+# /metrics. Under `backend.py serve` every worker process has its own numbers; with
+# DASHAMI_METRICS_DIR set, each one writes a snapshot to <dir>/<pid>.json about once a
+# second and /metrics adds up all of them, so whichever worker answers the scrape
+# reports the whole server.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FLUSH_INTERVAL = 1.0
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help_text, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}   # label values tuple -> number (counter) or [bucket counts..., sum] (histogram)
+
+    def key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            self.registry.dirty = True
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # one slot per bucket, one for +Inf, then the sum
+                entry = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+            self.registry.dirty = True
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def label_text(names, values, extra=None):
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Registry:
+    def __init__(self, directory=None):
+        self.lock = threading.Lock()
+        self.metrics = []
+        self.dirty = False
+        self.directory = directory
+        self._flusher = None
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(self, name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(self, name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        # {metric name: [[label values, value], ...]}, JSON-friendly
+        with self.lock:
+            self.dirty = False
+            return {m.name: [[list(k), list(v) if isinstance(v, list) else v] for k, v in m.values.items()]
+                    for m in self.metrics}
+
+    # --- Sharing between worker processes ---
+    def start_flusher(self):
+        if not self.directory or self._flusher:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            if self.dirty:
+                self.flush()
+
+    def flush(self):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"[!] Could not write metrics snapshot: {e}")
+
+    def collect(self):
+        # this process's live numbers plus the last snapshot of every other process
+        snapshots = [self.snapshot()]
+        if self.directory and os.path.isdir(self.directory):
+            own = f"{os.getpid()}.json"
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json') or name == own:
+                    continue
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        merged = {}
+        for snap in snapshots:
+            for name, series in snap.items():
+                target = merged.setdefault(name, {})
+                for labels, value in series:
+                    key = tuple(labels)
+                    if isinstance(value, list):
+                        current = target.get(key)
+                        target[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    def render(self):
+        merged = self.collect()
+        lines = []
+        for m in self.metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for key, value in sorted(merged.get(m.name, {}).items()):
+                if m.kind == 'counter':
+                    lines.append(f"{m.name}{label_text(m.labels, key)} {number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(m.buckets + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append(f"{m.name}_bucket{label_text(m.labels, key, ('le', bound))} {cumulative}")
+                lines.append(f"{m.name}_sum{label_text(m.labels, key)} {number(value[-1])}")
+                lines.append(f"{m.name}_count{label_text(m.labels, key)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry(os.environ.get('DASHAMI_METRICS_DIR') or None)
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'dashami_request_duration_seconds', 'Time to build a response, by route', ('method', 'route', 'status'))
+SLOW_REQUESTS = REGISTRY.counter(
+    'dashami_slow_requests_total', 'Requests slower than SLOW_REQUEST_SECONDS', ('method', 'route'))
+STORAGE_READ_BYTES = REGISTRY.counter(
+    'dashami_storage_read_bytes_total', 'Bytes read from catalog files', ('file',))
+STORAGE_WRITTEN_BYTES = REGISTRY.counter(
+    'dashami_storage_written_bytes_total', 'Bytes written to catalog files', ('file',))
+STORAGE_SECONDS = REGISTRY.histogram(
+    'dashami_storage_seconds', 'Time spent reading, parsing and writing catalog files', ('op', 'file'))
+IMAGE_SECONDS = REGISTRY.histogram(
+    'dashami_image_seconds', 'Time spent on image work: decode/encode, derivatives, hashing and moves', ('op',))
+GC_DELETED_FILES = REGISTRY.counter(
+    'dashami_gc_deleted_files_total', 'Unreferenced image files removed by the background collector', ('folder',))
+GC_RECLAIMED_BYTES = REGISTRY.counter(
+    'dashami_gc_reclaimed_bytes_total', 'Bytes freed by the background image collector', ('folder',))
+LISTING_CACHE_REQUESTS = REGISTRY.counter(
+    'dashami_listing_cache_requests_total', 'Listing reads answered from the response cache (hit) or built (miss)', ('result',))
+LISTING_CACHE_DROPPED = REGISTRY.counter(
+    'dashami_listing_cache_dropped_total', 'Cached listings dropped: stale after a change, or evicted for space', ('reason',))
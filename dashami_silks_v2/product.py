@@ -0,0 +1,106 @@
+import sys
+
+# In-memory form of a product in the JSON catalog store. A dict per product carries a
+# hash table for its 15 keys; a Product keeps the usual fields in slots, anything else
+# (visible, keys from older data files) in `extra`, and the key order of the dict it was
+# made from in `layout`, one tuple shared by every product with the same keys. Category,
+# fabric, color and stock values are interned, so a large catalog holds a few dozen of
+# those strings instead of one per product. Derivatives named the way backend.py names
+# them are kept as (path, keys, placeholder) and their paths rebuilt on the way out; they
+# are most of what a published product weighs. to_dict() gives back a dict equal to the
+# original with its keys in the same order, so the API and data.json are unchanged.
+# Records are never modified: a change to a product replaces its record.
+FIELDS = ('id', 'name', 'category', 'fabric', 'color', 'price', 'discount_price', 'desc',
+          'stars', 'stock', 'stock_count', 'image', 'gallery', 'timestamp', 'derivatives')
+INTERNED = frozenset(('category', 'fabric', 'color', 'stock'))
+MAX_LAYOUTS = 10000   # distinct key orders worth sharing; past this each record keeps its own
+
+_FIELD_SET = frozenset(FIELDS)
+_MISSING = object()
+_layouts = {}
+
+def derivative_stem(path):
+    # backend.derivative_path(path, width) is this + f"{width}.webp" for the paths products
+    # use; pack_derivatives checks every name, so any other path is simply left unpacked
+    dot = path.rfind('.')
+    return (path[:dot] if dot > path.rfind('/') + 1 else path) + '_w'
+
+def pack_derivatives(derivatives, paths):
+    # ((path, keys, placeholder), ...) when every entry is named by derivative_stem, else None;
+    # paths maps the product's image paths to themselves, so the keys share those strings
+    if type(derivatives) is not dict:
+        return None
+    packed = []
+    for path, entry in derivatives.items():
+        if type(entry) is not dict or type(path) is not str:
+            return None
+        stem = derivative_stem(path)
+        for key, value in entry.items():
+            if key != 'placeholder' and value != f"{stem}{key}.webp":
+                return None
+        keys = tuple(entry)
+        if len(_layouts) < MAX_LAYOUTS:
+            keys = _layouts.setdefault(keys, keys)
+        packed.append((paths.get(path, path), keys, entry.get('placeholder')))
+    return tuple(packed)
+
+def unpack_derivatives(packed):
+    result = {}
+    for path, keys, placeholder in packed:
+        stem = derivative_stem(path)
+        result[path] = {key: placeholder if key == 'placeholder' else f"{stem}{key}.webp" for key in keys}
+    return result
+
+class Product:
+    __slots__ = FIELDS + ('extra', 'layout')
+
+    @classmethod
+    def from_dict(cls, data):
+        product = cls.__new__(cls)
+        extra = None
+        for key, value in data.items():
+            if key in _FIELD_SET:
+                if key in INTERNED and type(value) is str:
+                    value = sys.intern(value)
+                elif key == 'derivatives':
+                    paths = [getattr(product, 'image', None)] + list(getattr(product, 'gallery', None) or [])
+                    packed = pack_derivatives(value, {p: p for p in paths if type(p) is str})
+                    if packed is not None:
+                        value = packed
+                setattr(product, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        product.extra = extra
+        layout = tuple(data)
+        if len(_layouts) < MAX_LAYOUTS:
+            layout = _layouts.setdefault(layout, layout)
+        product.layout = layout
+        return product
+
+    def to_dict(self):
+        extra = self.extra
+        result = {key: getattr(self, key) if key in _FIELD_SET else extra[key] for key in self.layout}
+        if type(result.get('derivatives')) is tuple:
+            result['derivatives'] = unpack_derivatives(result['derivatives'])
+        return result
+
+    # read-only mapping access, for code written against product dicts
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            value = getattr(self, key, default)
+            return unpack_derivatives(value) if key == 'derivatives' and type(value) is tuple else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __repr__(self):
+        return f"Product({self.to_dict()!r})"
@@ -0,0 +1,75 @@
+import os
+import re
+import gzip
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from storage import file_signature
+
+# Text assets (HTML/CSS/JS/JSON) are compressed once and kept in memory per encoding;
+# an entry is rebuilt when the file's (inode, mtime, size) signature changes.
+# Content-hashed images (images/<sha>.<ext>, images/<sha>_w320.webp) never change
+# under the same name, so they can be cached by browsers for a year.
+COMPRESSIBLE = {'.html', '.css', '.js', '.json', '.svg', '.txt'}
+MIN_COMPRESS_SIZE = 512
+MAX_COMPRESS_SIZE = 8 * 1024 * 1024
+SKIP_DIRS = {'images', '__pycache__', '.git'}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+HASHED_IMAGE = re.compile(r'^images/[0-9a-f]{32}(_w\d+)?\.[a-z0-9]+$')
+
+def is_immutable(path):
+    return bool(HASHED_IMAGE.match(path))
+
+def is_compressible(path):
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE
+
+class StaticFiles:
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self._variants = {}   # rel path -> (signature, {"gzip": bytes, "br": bytes})
+
+    @property
+    def encodings(self):
+        return ['br', 'gzip'] if brotli else ['gzip']
+
+    def _build(self, path):
+        with open(os.path.join(self.root, path), 'rb') as f:
+            data = f.read()
+        variants = {"gzip": gzip.compress(data, 9, mtime=0)}
+        if brotli:
+            variants["br"] = brotli.compress(data, quality=11)
+        # a variant that does not shrink the file is not worth sending
+        return {k: v for k, v in variants.items() if len(v) < len(data)}
+
+    def variant(self, path, encoding):
+        # (body, signature) of the precompressed file, or None to send it as-is
+        if not encoding or not is_compressible(path):
+            return None
+        signature = file_signature(os.path.join(self.root, path))
+        if not signature or not MIN_COMPRESS_SIZE <= signature[2] <= MAX_COMPRESS_SIZE:
+            return None
+        with self.lock:
+            cached = self._variants.get(path)
+        if not cached or cached[0] != signature:
+            cached = (signature, self._build(path))
+            with self.lock:
+                self._variants[path] = cached
+        body = cached[1].get(encoding)
+        return (body, signature) if body is not None else None
+
+    def prebuild(self):
+        # compress every text asset up front so the first visitor does not pay for it
+        for folder, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+            for name in files:
+                path = os.path.relpath(os.path.join(folder, name), self.root).replace(os.sep, '/')
+                for encoding in self.encodings:
+                    try:
+                        self.variant(path, encoding)
+                    except OSError:
+                        pass
@@ -0,0 +1,1076 @@
+import os
+import re
+import json
+import bisect
+import collections
+import time
+import shutil
+import uuid
+import sqlite3
+import tempfile
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None   # Windows: single-process only
+
+from metrics import STORAGE_READ_BYTES, STORAGE_WRITTEN_BYTES, STORAGE_SECONDS
+from product import Product
+
+BACKUP_COUNT = 5
+BACKUP_INTERVAL = 300
+ID_PREFIX = 'DS-'
+ID_FLOOR = 100
+
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+_last_backup = {}
+
+# --- 1. FILE HELPERS ---
+def file_label(path):
+    # metric label for a file; per-upload names collapse to one series
+    return re.sub(r'[0-9a-f]{8,}', '*', os.path.basename(path))
+
+def load_json(path, default_type=[]):
+    if not os.path.exists(path):
+        return default_type
+    label = file_label(path)
+    try:
+        with STORAGE_SECONDS.time(op='load', file=label):
+            with open(path, 'r') as f:
+                content = f.read()
+            STORAGE_READ_BYTES.inc(len(content), file=label)
+            content = content.strip()
+            return json.loads(content) if content else default_type
+    except:
+        return default_type
+
+def file_lock(path):
+    path = os.path.abspath(path)
+    with _file_locks_guard:
+        lock = _file_locks.get(path)
+        if lock is None:
+            lock = _file_locks[path] = threading.RLock()
+        return lock
+
+@contextlib.contextmanager
+def process_lock(path, shared=False):
+    # lock on <path>.lock held across processes (server workers); take it after any thread lock
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Windows cannot open directories
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def rotate_backups(path, backup_path, count=BACKUP_COUNT, interval=BACKUP_INTERVAL):
+    # backup_path is the newest copy, backup_path.1 .. backup_path.N the older ones.
+    # At most one rotation per interval, so a burst of saves does not flush history.
+    if not os.path.exists(path):
+        return
+    now = time.time()
+    if now - _last_backup.get(backup_path, 0) < interval:
+        return
+    try:
+        for i in range(count - 1, 0, -1):
+            src = backup_path if i == 1 else f"{backup_path}.{i - 1}"
+            if os.path.exists(src):
+                os.replace(src, f"{backup_path}.{i}")
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+        try:
+            # save_json replaces path with a new file, so a hard link keeps the old contents without copying
+            os.link(path, backup_path)
+        except OSError:
+            shutil.copyfile(path, backup_path)
+        _last_backup[backup_path] = now
+    except OSError as e:
+        print(f"[!] Backup rotation failed: {e}")
+
+def save_json(path, data, backup_path=None, default=None):
+    label = file_label(path)
+    with file_lock(path), STORAGE_SECONDS.time(op='save', file=label):
+        if backup_path:
+            with STORAGE_SECONDS.time(op='backup', file=label):
+                rotate_backups(path, backup_path)
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=4, default=default)
+                f.flush()
+                os.fsync(f.fileno())
+                STORAGE_WRITTEN_BYTES.inc(f.tell(), file=label)
+            if os.path.exists(path):
+                shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        fsync_dir(directory)
+
+def file_signature(path):
+    # (inode, mtime, size) changes whenever the file is rewritten or replaced
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def read_journal(path, offset=0):
+    # entries from byte offset on: (entries, torn, end offset). torn means the file
+    # needs rewriting before it is appended to again
+    entries, torn = [], False
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except OSError:
+        return entries, torn, 0
+    STORAGE_READ_BYTES.inc(len(data), file=file_label(path))
+    end = offset
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b'\n'):
+            # a torn last line from a crash mid-append; everything before it is intact
+            print(f"[!] Skipping unfinished journal line in {path}")
+            torn = True
+            break
+        end += len(line)
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            print(f"[!] Skipping unreadable journal line in {path}")
+            torn = True
+    return entries, torn, end
+
+def journal_header(path):
+    try:
+        with open(path, 'rb') as f:
+            entry = json.loads(f.readline() or b'null')
+    except (OSError, ValueError):
+        return None
+    return entry if isinstance(entry, dict) and entry.get("op") == "header" else None
+
+def sort_products(items, sort=None):
+    if sort == 'newest':
+        return sorted(items, key=lambda x: x.get('timestamp', 0), reverse=True)
+    if sort == 'oldest':
+        return sorted(items, key=lambda x: x.get('timestamp', 0))
+    return items
+
+def id_number(pid):
+    match = re.search(r'\d+', str(pid))
+    return int(match.group()) if match else None
+
+# Last issued DS number. Seeded once from the existing ids, then only moves up, so
+# an id is never handed out twice, even after its product is deleted for good.
+class IdCounter:
+    def __init__(self, path, seed_ids):
+        self.path = path
+        self.lock = threading.Lock()
+        state = load_json(path, {}) if path else {}
+        if isinstance(state, dict) and isinstance(state.get('last_id'), int):
+            self.last = state['last_id']
+        else:
+            numbers = [n for n in map(id_number, seed_ids()) if n is not None]
+            self.last = max([ID_FLOOR] + numbers)
+            self._save()
+
+    def _save(self):
+        if self.path:
+            save_json(self.path, {"last_id": self.last})
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # other worker processes may have moved the counter on since we last looked
+        with self.lock:
+            if not self.path:
+                yield
+                return
+            with process_lock(self.path):
+                state = load_json(self.path, {})
+                if isinstance(state, dict) and isinstance(state.get('last_id'), int):
+                    self.last = max(self.last, state['last_id'])
+                yield
+
+    def allocate(self):
+        with self._locked():
+            self.last += 1
+            self._save()
+            return f"{ID_PREFIX}{self.last}"
+
+    def observe(self, *pids):
+        n = max([n for n in map(id_number, pids) if n is not None], default=None)
+        if n is None or n <= self.last:
+            return
+        with self._locked():
+            if n > self.last:
+                self.last = n
+                self._save()
+
+# --- 2. SEARCH INDEX ---
+# Inverted indexes for one collection, kept up to date on every change so a
+# filtered /api/products query never has to scan product dicts.
+FACETS = ('category', 'fabric', 'color', 'stock')
+SEARCH_FIELDS = ('name', 'category', 'fabric', 'color', 'id')
+
+def normalize(value):
+    return str(value or '').strip().lower()
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', str(text or '').lower())
+
+def effective_price(product):
+    try:
+        return float(product.get('discount_price') or product.get('price') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def intersect(sets):
+    result = None
+    for s in sets:
+        result = set(s) if result is None else result & s
+    return result
+
+class CatalogIndex:
+    def __init__(self, products=()):
+        self.facets = {f: {} for f in FACETS}   # field -> value -> ids
+        self.labels = {f: {} for f in FACETS}   # field -> value -> display label
+        self.tokens = {}                        # word -> ids
+        self.prices = {}                        # id -> effective price
+        self._entries = {}                      # id -> (facet values, words), for removal
+        self._by_price = None
+        for product in products:
+            self.add(product)
+
+    def add(self, product):
+        pid = product['id']
+        self.remove(pid)
+        values = {}
+        for f in FACETS:
+            key = normalize(product.get(f))
+            if key:
+                self.facets[f].setdefault(key, set()).add(pid)
+                self.labels[f].setdefault(key, str(product.get(f)).strip())
+                values[f] = key
+        words = set(tokenize(' '.join(str(product.get(f) or '') for f in SEARCH_FIELDS)))
+        for word in words:
+            self.tokens.setdefault(word, set()).add(pid)
+        self.prices[pid] = effective_price(product)
+        self._entries[pid] = (values, words)
+        self._by_price = None
+
+    def remove(self, pid):
+        entry = self._entries.pop(pid, None)
+        if entry is None:
+            return
+        values, words = entry
+        for f, key in values.items():
+            ids = self.facets[f][key]
+            ids.discard(pid)
+            if not ids:
+                del self.facets[f][key]
+                del self.labels[f][key]
+        for word in words:
+            ids = self.tokens[word]
+            ids.discard(pid)
+            if not ids:
+                del self.tokens[word]
+        del self.prices[pid]
+        self._by_price = None
+
+    def match_text(self, q):
+        # every query word has to appear inside some word of the product (same idea as the storefront search)
+        result = None
+        for word in tokenize(q):
+            ids = set()
+            for token, token_ids in self.tokens.items():
+                if word in token:
+                    ids |= token_ids
+            result = ids if result is None else result & ids
+            if not result:
+                break
+        return result
+
+    def match_price(self, min_price, max_price):
+        if self._by_price is None:
+            self._by_price = sorted((price, pid) for pid, price in self.prices.items())
+        lo = 0 if min_price is None else bisect.bisect_left(self._by_price, (min_price, ''))
+        hi = len(self._by_price)
+        if max_price is not None:
+            hi = bisect.bisect_right(self._by_price, (max_price, '\uffff'))
+        return {pid for _, pid in self._by_price[lo:hi]}
+
+    def search(self, filters=None, q=None, min_price=None, max_price=None):
+        # returns (matching ids or None for "no filter", facet counts). Each facet is
+        # counted with every filter except its own, so the UI can show what a click would give.
+        sets = {}
+        for f in FACETS:
+            values = (filters or {}).get(f)
+            if values:
+                sets[f] = set().union(*(self.facets[f].get(normalize(v), ()) for v in values))
+        if q and tokenize(q):
+            sets['q'] = self.match_text(q)
+        if min_price is not None or max_price is not None:
+            sets['price'] = self.match_price(min_price, max_price)
+        facets = {}
+        for f in FACETS:
+            base = intersect(s for k, s in sets.items() if k != f)
+            counts = {}
+            for key, ids in self.facets[f].items():
+                n = len(ids) if base is None else len(ids & base)
+                if n:
+                    counts[self.labels[f][key]] = n
+            facets[f] = counts
+        return intersect(sets.values()), facets
+
+# --- 3. CATALOG STORE ---
+# Keeps main / unfilled / trash in memory as {id: product} dicts (insertion
+# ordered, same order as the JSON arrays). Every mutation is one journal entry:
+#   upsert       {"col", "product", "from"}   (from: collection to drop the id from, e.g. unfilled on publish)
+#   trash        {"from", "product"}
+#   restore      {"product"}
+#   perm-delete  {"id"}
+# With a journal the entry is appended to a JSONL file and the JSON snapshots are
+# only rewritten on compaction; without one the touched collections are saved directly.
+# Snapshot files edited outside the server are picked up on the next read; the journal
+# entries since the last compaction are reapplied on top, since the file does not have them.
+# Every change bumps the catalog version; version_of(name) is the version of the
+# last change that touched that collection, which is what HTTP validators use.
+# The last CHANGE_LOG_SIZE versions are kept as change events for /api/events:
+#   {"version", "id", "collection", "op", "product"}   (no product: it left that collection)
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+CHANGE_LOG_SIZE = 1000
+CHANGE_POLL_INTERVAL = 0.5
+
+def change_events(version, entry, names, current):
+    # current(name, pid) -> product now in that collection, or None
+    if entry is None:
+        return [{"version": version, "id": None, "collection": name, "op": "reload"} for name in names]
+    pid = entry["product"]["id"] if "product" in entry else entry["id"]
+    events = []
+    for name in names:
+        event = {"version": version, "id": pid, "collection": name, "op": entry["op"]}
+        product = current(name, pid)
+        if product is not None:
+            event["product"] = product
+        events.append(event)
+    return events
+
+def move_entry(to, source, product):
+    # journal entry moving a product from `source` to the trash, or out of it back to main
+    if to == 'trash':
+        return {"op": "trash", "from": source, "product": product}
+    return {"op": "restore", "product": product}
+
+def image_files(product):
+    # every file a product points at: main image, gallery and derivative copies
+    files = [product.get('image')] + list(product.get('gallery') or [])
+    for entry in (product.get('derivatives') or {}).values():
+        files += [path for key, path in entry.items() if key != 'placeholder']
+    return [f for f in dict.fromkeys(files) if f and isinstance(f, str)]
+
+class CatalogStore:
+    def __init__(self, files, backups=None, journal=None, counter=None, compact_bytes=JOURNAL_COMPACT_BYTES):
+        self.files = dict(files)
+        self.backups = dict(backups or {})
+        self.journal = journal
+        self.compact_bytes = compact_bytes
+        self.lock = threading.RLock()
+        self._lock_path = journal or self.files['main']
+        self._products = {}
+        self._signatures = {}
+        self._indexes = {}
+        self._order = {}
+        self._refs = collections.Counter()   # image path -> products (in any collection) using it
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._versions = {}
+        self._modified = {}
+        self._changes = collections.deque()   # (version, events), oldest first
+        self._changes_floor = 0               # changes after this version are all in the log
+        self._changes_cond = threading.Condition()
+        self._journal_header = None           # header line of the journal we have read
+        self._journal_pos = 0                 # bytes of it applied
+        self._journal_sig = None
+        with self.lock:
+            for name in self.files:
+                self._load(name)
+            if self.journal:
+                with process_lock(self._lock_path):
+                    entries, torn, self._journal_pos = read_journal(self.journal)
+                    if entries and entries[0].get("op") == "header":
+                        # carry on the numbering of the process that wrote the snapshots
+                        self._journal_header = entries.pop(0)
+                        self.epoch = self._journal_header.get("epoch", self.epoch)
+                        self.version = self._journal_header.get("version", 0)
+                        self._versions = dict.fromkeys(self.files, self.version)
+                    for entry in entries:
+                        self._replay(entry)
+                    self._journal_sig = file_signature(self.journal)
+                    if torn or not self._journal_header or self._journal_pos > self.compact_bytes:
+                        self._compact_locked()
+            self.counter = IdCounter(counter, self.ids)
+            self._changes.clear()
+            self._changes_floor = self.version
+
+    def _load(self, name, bump=True):
+        path = self.files[name]
+        signature = file_signature(path)
+        items = load_json(path, [])
+        if not isinstance(items, list):
+            items = []
+        for product in self._products.get(name, {}).values():
+            self._refs.subtract(image_files(product))
+        self._products[name] = {p['id']: Product.from_dict(p) for p in items if isinstance(p, dict) and 'id' in p}
+        for product in self._products[name].values():
+            self._refs.update(image_files(product))
+        self._signatures[name] = signature
+        self._indexes[name] = CatalogIndex(self._products[name].values())
+        self._modified[name] = os.path.getmtime(path) if signature else time.time()
+        self._changed(name)
+        if bump:
+            self._bump([name], self._modified[name])
+
+    def _bump(self, names, when=None, entry=None):
+        self.version += 1
+        for name in names:
+            self._versions[name] = self.version
+            self._modified[name] = when or time.time()
+        if len(self._changes) >= CHANGE_LOG_SIZE:
+            self._changes_floor = self._changes.popleft()[0]
+        self._changes.append((self.version, change_events(self.version, entry, names, self._current)))
+        with self._changes_cond:
+            self._changes_cond.notify_all()
+
+    def _changed(self, name):
+        for key in [k for k in self._order if k[0] == name]:
+            del self._order[key]
+
+    def _journal_size(self):
+        try:
+            return os.path.getsize(self.journal)
+        except OSError:
+            return 0
+
+    # --- Multi-process coherence ---
+    # Every process (server worker) keeps its own copy in memory. Writes happen under an
+    # exclusive process_lock after catching up, so the journal is one ordered log that every
+    # process replays: versions stay identical across processes. Compaction rewrites the
+    # journal starting with a header {"op": "header", "epoch", "version", "gen"}; a process
+    # that finds a new header picks up the snapshots it was written with.
+    def _replay(self, entry):
+        touched = self._apply(entry)
+        if touched:
+            self._bump(touched, entry.get("ts"), entry)
+
+    def _adopt(self, header):
+        self._journal_header = header
+        if (header.get("epoch"), header.get("version")) == (self.epoch, self.version):
+            # our copy already matches the snapshots that were just written
+            for name in self.files:
+                self._signatures[name] = file_signature(self.files[name])
+            return
+        for name in self.files:
+            self._load(name, bump=False)
+        if header.get("version", 0) <= self.version:
+            self._changes.clear()
+            self._changes_floor = header.get("version", 0)
+        self.epoch = header.get("epoch", self.epoch)
+        self.version = header.get("version", 0) - 1
+        self._bump(list(self.files))
+
+    def _outdated(self):
+        if self.journal and file_signature(self.journal) != self._journal_sig:
+            return True
+        return any(file_signature(path) != self._signatures.get(name) for name, path in self.files.items())
+
+    def _sync(self):
+        # catch up with other processes; returns collections whose snapshot was edited by hand
+        if self.journal:
+            if journal_header(self.journal) != self._journal_header:
+                self._journal_pos = 0
+            entries, _, self._journal_pos = read_journal(self.journal, self._journal_pos)
+            for entry in entries:
+                if entry.get("op") == "header":
+                    self._adopt(entry)
+                else:
+                    self._replay(entry)
+            self._journal_sig = file_signature(self.journal)
+        changed = [n for n, path in self.files.items() if file_signature(path) != self._signatures.get(n)]
+        if changed:
+            self._reload(changed)
+        return changed
+
+    def _reload(self, names):
+        # snapshots edited by hand: load them, then reapply the journal entries written since
+        # the last compaction, which a snapshot on disk never has
+        for name in names:
+            self._load(name)
+        if self.journal:
+            for entry in read_journal(self.journal)[0]:
+                if entry.get("op") != "header":
+                    self._apply(entry, only=names)
+
+    def refresh(self, name=None):
+        with self.lock:
+            if not self._outdated():
+                return
+            with process_lock(self._lock_path, shared=True):
+                changed = self._sync()
+            if changed and self.journal:
+                # write the edited snapshots back with the journal folded in
+                self.compact()
+
+    def persist(self, name):
+        with self.lock:
+            path = self.files[name]
+            save_json(path, list(self._products[name].values()), self.backups.get(name), default=Product.to_dict)
+            self._signatures[name] = file_signature(path)
+
+    def compact(self):
+        with self.lock, process_lock(self._lock_path):
+            self._sync()
+            self._compact_locked()
+
+    def _compact_locked(self):
+        for name in self.files:
+            self.persist(name)
+        if self.journal:
+            header = {"op": "header", "epoch": self.epoch, "version": self.version, "gen": uuid.uuid4().hex[:8]}
+            line = json.dumps(header, separators=(',', ':')) + '\n'
+            with file_lock(self.journal):
+                tmp_path = self.journal + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.journal)
+            self._journal_header = header
+            self._journal_pos = len(line.encode())
+            self._journal_sig = file_signature(self.journal)
+
+    # --- Reads ---
+    def current_version(self):
+        with self.lock:
+            self.refresh()
+            return self.version
+
+    def version_of(self, name):
+        with self.lock:
+            self.refresh(name)
+            return self._versions[name]
+
+    def modified_of(self, name):
+        with self.lock:
+            self.refresh(name)
+            return self._modified[name]
+
+    def changes_since(self, version):
+        # (events, version they run up to); events is None when the log no longer reaches back that far
+        with self.lock:
+            self.refresh()
+            if version < self._changes_floor or version > self.version:
+                return None, self.version
+            events = [e for v, group in self._changes if v > version for e in group]
+            return events, self.version
+
+    def wait_for_change(self, version, timeout):
+        # other processes do not notify us, so look at the files every CHANGE_POLL_INTERVAL
+        deadline = time.time() + timeout
+        while True:
+            current = self.current_version()
+            remaining = deadline - time.time()
+            if current > version or remaining <= 0:
+                return current
+            with self._changes_cond:
+                if self.version <= version:
+                    self._changes_cond.wait(min(remaining, CHANGE_POLL_INTERVAL))
+
+    # products are kept as Product records (product.py); callers always get dicts
+    def all(self, name, sort=None):
+        with self.lock:
+            self.refresh(name)
+            items = list(self._products[name].values())
+        return [p.to_dict() for p in sort_products(items, sort)]
+
+    def get(self, name, pid):
+        with self.lock:
+            self.refresh(name)
+            return self._current(name, pid)
+
+    def _current(self, name, pid):
+        item = self._products[name].get(pid)
+        return item.to_dict() if item is not None else None
+
+    def find(self, pid, names):
+        for name in names:
+            item = self.get(name, pid)
+            if item is not None:
+                return name, item
+        return None, None
+
+    def ids(self):
+        with self.lock:
+            self.refresh()
+            return [pid for products in self._products.values() for pid in products]
+
+    def query(self, name, sort=None, filters=None, q=None, min_price=None, max_price=None, offset=0, limit=50):
+        with self.lock:
+            self.refresh(name)
+            matched, facets = self._indexes[name].search(filters, q, min_price, max_price)
+            key = (name, sort)
+            if key not in self._order:
+                self._order[key] = [p['id'] for p in sort_products(list(self._products[name].values()), sort)]
+            ordered = self._order[key]
+            if matched is not None:
+                ordered = [pid for pid in ordered if pid in matched]
+            products = self._products[name]
+            items = [products[pid].to_dict() for pid in ordered[offset:offset + limit]]
+            return {"items": items, "total": len(ordered), "facets": facets}
+
+    def referenced_files(self):
+        # every image path some product in some collection uses
+        with self.lock:
+            self.refresh()
+            return {path for path, count in self._refs.items() if count > 0}
+
+    def allocate_id(self):
+        return self.counter.allocate()
+
+    # --- Writes ---
+    def upsert(self, name, product, drop_from=None):
+        entry = {"op": "upsert", "col": name, "product": product}
+        if drop_from:
+            entry["from"] = drop_from
+        self._commit(entry)
+
+    def trash(self, source, product):
+        self._commit({"op": "trash", "from": source, "product": product})
+
+    def restore(self, product):
+        self._commit({"op": "restore", "product": product})
+
+    def move(self, pid, to):
+        # trash ('trash') or restore ('main') by id; False when it is not where it would move
+        # from. The product is read once this process has caught up, under the write lock, so
+        # an edit another process made to it since our last read is moved along, not undone
+        def entries():
+            for name in (['main', 'unfilled'] if to == 'trash' else ['trash']):
+                product = self._current(name, pid)
+                if product is not None:
+                    return [move_entry(to, name, product)]
+            return []
+        return bool(self.commit_batch(entries))
+
+    def perm_delete(self, pid):
+        # returns the image files no product references any more
+        with self.lock:
+            product = self.get('trash', pid)
+            self._commit({"op": "perm-delete", "id": pid})
+            return [f for f in image_files(product or {}) if self._refs[f] <= 0]
+
+    def _commit(self, entry):
+        self.commit_batch([entry])
+
+    def commit_batch(self, entries):
+        # journal entries applied together: one journal write (or one save per collection).
+        # `entries` may also be a function returning them, called after catching up with the
+        # other processes, for writes that depend on the current state; returns the entries
+        with self.lock, process_lock(self._lock_path):
+            if self._sync() and self.journal:
+                self._compact_locked()
+            if callable(entries):
+                entries = entries()
+            if not entries:
+                return entries
+            now = int(time.time())
+            for entry in entries:
+                entry["ts"] = now
+            if self.journal:
+                self._append(entries)
+            changes = [(entry, self._apply(entry)) for entry in entries]
+            if not self.journal:
+                for name in dict.fromkeys(n for _, touched in changes for n in touched):
+                    self.persist(name)
+            for entry, touched in changes:
+                if touched:
+                    self._bump(touched, entry=entry)
+            if self.journal and self._journal_pos > self.compact_bytes:
+                self._compact_locked()
+        self.counter.observe(*[e["product"]["id"] for e in entries if e["op"] == "upsert"])
+        return entries
+
+    def _append(self, entries):
+        lines = ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries)
+        label = file_label(self.journal)
+        with file_lock(self.journal), STORAGE_SECONDS.time(op='append', file=label):
+            with open(self.journal, 'a') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+                STORAGE_WRITTEN_BYTES.inc(len(lines.encode()), file=label)
+                self._journal_pos = f.tell()
+        self._journal_sig = file_signature(self.journal)
+
+    def _set(self, name, product):
+        product = Product.from_dict(product)
+        products = self._products[name]
+        old = products.pop(product['id'], None)
+        if old is not None:
+            self._refs.subtract(image_files(old))
+        products[product['id']] = product
+        self._refs.update(image_files(product))
+        self._indexes[name].add(product)
+        self._changed(name)
+
+    def _drop(self, name, pid):
+        old = self._products[name].pop(pid, None)
+        if old is None:
+            return False
+        self._refs.subtract(image_files(old))
+        self._indexes[name].remove(pid)
+        self._changed(name)
+        return True
+
+    def _apply(self, entry, only=None):
+        # returns the collections the entry changed; with `only`, other collections are left as they are
+        op = entry.get("op")
+        touched = []
+        set_, drop = self._set, self._drop
+        if only is not None:
+            set_ = lambda name, product: name in only and self._set(name, product)
+            drop = lambda name, pid: name in only and self._drop(name, pid)
+        if op == "upsert":
+            set_(entry["col"], entry["product"])
+            touched.append(entry["col"])
+            if entry.get("from") and drop(entry["from"], entry["product"]["id"]):
+                touched.append(entry["from"])
+        elif op == "trash":
+            drop(entry["from"], entry["product"]["id"])
+            set_("trash", entry["product"])
+            touched += [entry["from"], "trash"]
+        elif op == "restore":
+            drop("trash", entry["product"]["id"])
+            set_("main", entry["product"])
+            touched += ["trash", "main"]
+        elif op == "perm-delete":
+            if drop("trash", entry["id"]):
+                touched.append("trash")
+        return touched
+
+# --- 4. SQLITE CATALOG STORE ---
+# Same interface as CatalogStore, backed by one products table where status is
+# main / unfilled / trash. seq keeps the JSON array order for unsorted listings.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    status TEXT NOT NULL,
+    id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL DEFAULT 0,
+    category TEXT COLLATE NOCASE,
+    fabric TEXT COLLATE NOCASE,
+    data TEXT NOT NULL,
+    PRIMARY KEY (status, id)
+);
+CREATE INDEX IF NOT EXISTS idx_products_id ON products (id);
+CREATE INDEX IF NOT EXISTS idx_products_seq ON products (status, seq);
+CREATE INDEX IF NOT EXISTS idx_products_timestamp ON products (status, timestamp);
+CREATE INDEX IF NOT EXISTS idx_products_category ON products (status, category);
+CREATE INDEX IF NOT EXISTS idx_products_fabric ON products (status, fabric);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER NOT NULL,
+    collection TEXT NOT NULL,
+    id TEXT,
+    op TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_version ON changes (version);
+"""
+
+FACET_SQL = {
+    'category': 'category',
+    'fabric': 'fabric',
+    'color': "TRIM(json_extract(data, '$.color'))",
+    'stock': "json_extract(data, '$.stock')",
+}
+SEARCH_SQL = "LOWER(" + " || ' ' || ".join(f"COALESCE(json_extract(data, '$.{f}'), '')" for f in SEARCH_FIELDS) + ")"
+PRICE_SQL = ("CAST(COALESCE(NULLIF(json_extract(data, '$.discount_price'), ''), "
+             "NULLIF(json_extract(data, '$.price'), ''), 0) AS REAL)")
+
+ORDER_BY = {
+    'newest': 'timestamp DESC, seq',
+    'oldest': 'timestamp, seq',
+    None: 'seq',
+}
+
+class SqliteCatalogStore:
+    def __init__(self, path, collections=('main', 'unfilled', 'trash')):
+        self.path = path
+        self.collections = tuple(collections)
+        self.lock = threading.RLock()
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex[:8],))
+        self.epoch = self.get_meta('epoch')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_meta(self, key, default=None):
+        row = self._conn().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, conn, key, value):
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def import_from(self, source):
+        # one-shot migration from a JSON CatalogStore (snapshots plus any journal entries)
+        with self.lock, self._conn() as conn:
+            for name in self.collections:
+                for product in source.all(name):
+                    self._insert(conn, name, product)
+            self._bump(conn, self.collections)
+            self.set_meta(conn, 'migrated_from_json', int(time.time()))
+
+    def refresh(self, name=None):
+        pass
+
+    def _bump(self, conn, names, entry=None):
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+        version = int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+        for name in names:
+            self.set_meta(conn, f'version:{name}', version)
+            self.set_meta(conn, f'modified:{name}', time.time())
+        if entry is None:
+            self.set_meta(conn, 'changes_floor', version)
+            return
+        pid = entry["product"]["id"] if "product" in entry else entry["id"]
+        conn.executemany('INSERT INTO changes (version, collection, id, op) VALUES (?, ?, ?, ?)',
+                         [(version, name, pid, entry["op"]) for name in names])
+        if version % 100 == 0:
+            floor = version - CHANGE_LOG_SIZE
+            conn.execute('DELETE FROM changes WHERE version <= ?', (floor,))
+            if floor > int(self.get_meta('changes_floor', 0)):
+                self.set_meta(conn, 'changes_floor', floor)
+
+    def compact(self):
+        try:
+            self._conn().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        except sqlite3.Error as e:
+            print(f"[!] WAL checkpoint failed: {e}")
+
+    # --- Reads ---
+    def current_version(self):
+        return int(self.get_meta('version', 0))
+
+    def version_of(self, name):
+        return int(self.get_meta(f'version:{name}', 0))
+
+    def modified_of(self, name):
+        return float(self.get_meta(f'modified:{name}', 0))
+
+    def changes_since(self, version):
+        current = self.current_version()
+        if version < int(self.get_meta('changes_floor', 0)) or version > current:
+            return None, current
+        rows = self._conn().execute(
+            'SELECT version, collection, id, op FROM changes WHERE version > ? AND version <= ? ORDER BY version',
+            (version, current)).fetchall()
+        entries = [({"op": op, "id": pid}, v, name) for v, name, pid, op in rows]
+        return [change_events(v, entry, [name], self.get)[0] for entry, v, name in entries], current
+
+    def wait_for_change(self, version, timeout):
+        # other processes write here too, so poll the version instead of waiting on a condition
+        deadline = time.time() + timeout
+        current = self.current_version()
+        while current <= version and time.time() < deadline:
+            time.sleep(CHANGE_POLL_INTERVAL)
+            current = self.current_version()
+        return current
+
+    def all(self, name, sort=None):
+        rows = self._conn().execute(
+            f'SELECT data FROM products WHERE status = ? ORDER BY {ORDER_BY.get(sort, "seq")}', (name,))
+        return [json.loads(r[0]) for r in rows]
+
+    def query(self, name, sort=None, filters=None, q=None, min_price=None, max_price=None, offset=0, limit=50):
+        clauses = {}
+        for f in FACETS:
+            values = [normalize(v) for v in (filters or {}).get(f) or [] if normalize(v)]
+            if values:
+                marks = ', '.join('?' * len(values))
+                clauses[f] = (f"LOWER(TRIM({FACET_SQL[f]})) IN ({marks})", values)
+        words = tokenize(q)
+        if words:
+            clauses['q'] = (' AND '.join([f"{SEARCH_SQL} LIKE ?"] * len(words)), [f"%{w}%" for w in words])
+        if min_price is not None:
+            clauses['min_price'] = (f"{PRICE_SQL} >= ?", [min_price])
+        if max_price is not None:
+            clauses['max_price'] = (f"{PRICE_SQL} <= ?", [max_price])
+
+        def where(skip=None):
+            parts, args = ['status = ?'], [name]
+            for k, (sql, values) in clauses.items():
+                if k != skip:
+                    parts.append(sql)
+                    args += values
+            return ' AND '.join(parts), args
+
+        conn = self._conn()
+        sql, args = where()
+        total = conn.execute(f'SELECT COUNT(*) FROM products WHERE {sql}', args).fetchone()[0]
+        rows = conn.execute(
+            f'SELECT data FROM products WHERE {sql} ORDER BY {ORDER_BY.get(sort, "seq")} LIMIT ? OFFSET ?',
+            args + [limit, offset])
+        items = [json.loads(r[0]) for r in rows]
+        facets = {}
+        for f in FACETS:
+            sql, args = where(skip=f)
+            expr = FACET_SQL[f]
+            rows = conn.execute(
+                f"SELECT MIN(TRIM({expr})), COUNT(*) FROM products WHERE {sql} AND COALESCE(TRIM({expr}), '') <> '' "
+                f"GROUP BY LOWER(TRIM({expr}))", args)
+            facets[f] = {label: n for label, n in rows}
+        return {"items": items, "total": total, "facets": facets}
+
+    def get(self, name, pid):
+        row = self._conn().execute(
+            'SELECT data FROM products WHERE status = ? AND id = ?', (name, pid)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, pid, names):
+        for name in names:
+            item = self.get(name, pid)
+            if item is not None:
+                return name, item
+        return None, None
+
+    def ids(self):
+        return [r[0] for r in self._conn().execute('SELECT id FROM products')]
+
+    def image_refs(self, path):
+        # paths are stored JSON-quoted inside data, so a substring match finds every use
+        return self._conn().execute(
+            'SELECT COUNT(*) FROM products WHERE instr(data, ?) > 0', (json.dumps(path),)).fetchone()[0]
+
+    def referenced_files(self):
+        files = set()
+        for (data,) in self._conn().execute('SELECT data FROM products'):
+            files.update(image_files(json.loads(data)))
+        return files
+
+    def _seed_counter(self, conn):
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'last_id'").fetchone():
+            return
+        numbers = [n for n in map(id_number, self.ids()) if n is not None]
+        self.set_meta(conn, 'last_id', max([ID_FLOOR] + numbers))
+
+    def allocate_id(self):
+        # the UPDATE takes the write lock, so concurrent workers never read the same value
+        with self.lock, self._conn() as conn:
+            self._seed_counter(conn)
+            conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'last_id'")
+            return f"{ID_PREFIX}{self.get_meta('last_id')}"
+
+    def _observe_id(self, conn, pid):
+        n = id_number(pid)
+        if n is None:
+            return
+        self._seed_counter(conn)
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'last_id' AND CAST(value AS INTEGER) < ?", (str(n), n))
+
+    # --- Writes ---
+    def _insert(self, conn, name, product):
+        conn.execute('DELETE FROM products WHERE status = ? AND id = ?', (name, product['id']))
+        conn.execute(
+            'INSERT INTO products (status, id, seq, timestamp, category, fabric, data) '
+            'VALUES (?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM products WHERE status = ?), ?, ?, ?, ?)',
+            (name, product['id'], name, product.get('timestamp') or 0,
+             str(product.get('category') or '').strip(), str(product.get('fabric') or '').strip(), json.dumps(product)))
+
+    def _delete(self, conn, name, pid):
+        return conn.execute('DELETE FROM products WHERE status = ? AND id = ?', (name, pid)).rowcount > 0
+
+    def upsert(self, name, product, drop_from=None):
+        entry = {"op": "upsert", "col": name, "product": product}
+        if drop_from:
+            entry["from"] = drop_from
+        self.commit_batch([entry])
+
+    def trash(self, source, product):
+        self.commit_batch([{"op": "trash", "from": source, "product": product}])
+
+    def restore(self, product):
+        self.commit_batch([{"op": "restore", "product": product}])
+
+    def move(self, pid, to):
+        # see CatalogStore.move; the lookup and the write share one IMMEDIATE transaction
+        with self.lock, self._conn() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            name, product = self.find(pid, ['main', 'unfilled'] if to == 'trash' else ['trash'])
+            if product is not None:
+                self.commit_batch([move_entry(to, name, product)])
+            return product is not None
+
+    def commit_batch(self, entries):
+        # same journal-entry format as CatalogStore, all in one transaction
+        with self.lock, STORAGE_SECONDS.time(op='commit', file=file_label(self.path)), self._conn() as conn:
+            for entry in entries:
+                product = entry["product"]
+                if entry["op"] == "upsert":
+                    self._insert(conn, entry["col"], product)
+                    self._observe_id(conn, product['id'])
+                    touched = [entry["col"]]
+                    if entry.get("from") and self._delete(conn, entry["from"], product['id']):
+                        touched.append(entry["from"])
+                elif entry["op"] == "trash":
+                    self._delete(conn, entry["from"], product['id'])
+                    self._insert(conn, 'trash', product)
+                    touched = [entry["from"], 'trash']
+                else:
+                    self._delete(conn, 'trash', product['id'])
+                    self._insert(conn, 'main', product)
+                    touched = ['trash', 'main']
+                self._bump(conn, touched, {"op": entry["op"], "id": product['id']})
+
+    def perm_delete(self, pid):
+        with self.lock:
+            product = self.get('trash', pid)
+            with self._conn() as conn:
+                self._delete(conn, 'trash', pid)
+                self._bump(conn, ['trash'], {"op": "perm-delete", "id": pid})
+            return [f for f in image_files(product or {}) if self.image_refs(f) == 0]
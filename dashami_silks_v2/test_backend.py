@@ -0,0 +1,437 @@
+import io
+import os
+import sys
+import json
+import hashlib
+import shutil
+import importlib
+import threading
+import time
+
+import pytest
+
+# Every test imports the server afresh from a copy of this folder's code under tmp_path
+# (empty catalog), so the real data files are never touched:
+#   python -m pytest -q test_backend.py
+HERE = os.path.dirname(os.path.abspath(__file__))
+CODE_FILES = sorted(f for f in os.listdir(HERE) if f.endswith('.py') or f in ('main.html', 'admin.html'))
+MODULES = [os.path.splitext(name)[0] for name in CODE_FILES if name.endswith('.py')]
+TEST_CONFIG = {'GC_INTERVAL': 0, 'PREBUILD_STATIC': False, 'IMAGE_WORKERS': 1}
+
+def sample_product(i):
+    return {"id": f"DS-{1000 + i}", "name": f"Test Saree {i}", "category": ["Silk", "Cotton"][i % 2],
+            "fabric": "Silk", "color": "Red", "price": str(1000 + i), "discount_price": "", "desc": "Test item",
+            "stars": 5, "stock": "in_stock", "stock_count": 3}
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    for name in CODE_FILES:
+        shutil.copy2(os.path.join(HERE, name), tmp_path)
+    for name in MODULES:
+        sys.modules.pop(name, None)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield importlib.import_module('backend')
+    for name in MODULES:
+        sys.modules.pop(name, None)
+
+@pytest.fixture
+def make_client(backend):
+    # one app per call, each with its own in-memory catalog over the same files, the way
+    # separate server workers share them
+    def make(**config):
+        app = backend.create_app(dict(TEST_CONFIG, **config))
+        client = app.test_client()
+        client.headers = {'X-API-Key': app.config['ADMIN_API_KEY']}
+        client.store = lambda: app.extensions['dashami'].store
+        return client
+    return make
+
+# --- atomic, locked saves: no lost updates under concurrent writers ---
+def test_parallel_add_and_move_lose_no_update(backend, make_client):
+    workers = [make_client(), make_client()]
+    threads, per_thread, errors = 8, 15, []
+
+    def run(t):
+        client = workers[t % len(workers)]
+        try:
+            for i in range(per_thread):
+                product = sample_product(t * 1000 + i)
+                r = client.post('/api/add-product', json=product, headers=client.headers)
+                assert r.status_code == 200, r.json
+                if i % 3 == 0:
+                    r = client.post('/api/move-product', json={"id": product["id"], "action": "trash"},
+                                    headers=client.headers)
+                    assert r.status_code == 200, r.json
+                if i % 6 == 0:
+                    r = client.post('/api/move-product', json={"id": product["id"], "action": "restore"},
+                                    headers=client.headers)
+                    assert r.status_code == 200, r.json
+        except Exception as e:
+            errors.append(e)
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    assert not errors, errors
+
+    ids = [(t, i, sample_product(t * 1000 + i)["id"]) for t in range(threads) for i in range(per_thread)]
+    expected_trash = sorted(pid for _, i, pid in ids if i % 3 == 0 and i % 6 != 0)
+    expected_main = sorted(pid for _, i, pid in ids if i % 3 != 0 or i % 6 == 0)
+    for client in workers:
+        main = client.get('/api/products?sort=none').json
+        trash = client.get('/api/products?source=trash').json
+        assert sorted(p["id"] for p in main) == expected_main
+        assert sorted(p["id"] for p in trash) == expected_trash
+    assert workers[0].store().current_version() == workers[1].store().current_version()
+
+    # what is on disk after compaction is what both workers served
+    workers[0].store().compact()
+    with open(backend.DATA_FILE) as f:
+        assert sorted(p["id"] for p in json.load(f)) == expected_main
+    with open(backend.TRASH_FILE) as f:
+        assert sorted(p["id"] for p in json.load(f)) == expected_trash
+    reopened = backend.open_json_store()
+    assert sorted(p["id"] for p in reopened.all('main')) == expected_main
+
+def test_concurrent_saves_never_expose_a_partial_file(backend, tmp_path):
+    storage = sys.modules['storage']
+    path, backup = str(tmp_path / 'data.json'), str(tmp_path / 'data.json.bak')
+    storage.save_json(path, [])
+    stop, seen, errors = threading.Event(), set(), []
+
+    def write(t):
+        for i in range(40):
+            storage.save_json(path, [{"id": f"DS-{t}", "n": i, "pad": "x" * 4096}] * (i % 5 + 1), backup)
+
+    def read():
+        while not stop.is_set():
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except ValueError as e:
+                errors.append(e)
+                continue
+            seen.add(len(data))
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    writers = [threading.Thread(target=write, args=(t,)) for t in range(4)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert not errors
+    assert len(seen) > 1
+    assert not [f for f in os.listdir(tmp_path) if f.endswith('.tmp')]
+    assert os.path.exists(backup)
+
+# --- journaled catalog: replay, hand edits and compaction across processes ---
+def open_store(tmp_path, **kwargs):
+    storage = sys.modules['storage']
+    files = {name: str(tmp_path / f'{name}.json') for name in ('main', 'unfilled', 'trash')}
+    return storage.CatalogStore(files, journal=str(tmp_path / 'journal.jsonl'), **kwargs)
+
+def test_hand_edited_snapshot_keeps_the_journaled_writes(backend, tmp_path):
+    store = open_store(tmp_path)
+    store.upsert('main', sample_product(1))
+    assert json.loads((tmp_path / 'main.json').read_text()) == []   # only in the journal so far
+
+    with open(tmp_path / 'main.json', 'w') as f:
+        json.dump([dict(sample_product(2), name="Added by hand")], f)
+    store.refresh()
+    assert sorted(p["id"] for p in store.all('main')) == ["DS-1001", "DS-1002"]
+    # the edit is written back with the journal folded in, so a fresh process agrees
+    assert sorted(p["id"] for p in json.loads((tmp_path / 'main.json').read_text())) == ["DS-1001", "DS-1002"]
+    assert sorted(p["id"] for p in open_store(tmp_path).all('main')) == ["DS-1001", "DS-1002"]
+
+def test_processes_follow_each_other_across_compactions(backend, tmp_path):
+    first, second = open_store(tmp_path, compact_bytes=2048), open_store(tmp_path, compact_bytes=2048)
+    for i in range(20):
+        (first if i % 2 else second).upsert('main', sample_product(i))
+    first.trash('main', first.get('main', "DS-1003"))
+    assert os.path.getsize(tmp_path / 'journal.jsonl') < 2048 + 1024   # compacted along the way
+
+    for store in (first, second):
+        store.refresh()
+        assert len(store.all('main')) == 19
+        assert [p["id"] for p in store.all('trash')] == ["DS-1003"]
+    assert first.version == second.version
+
+def test_torn_journal_line_is_skipped_on_startup(backend, tmp_path):
+    store = open_store(tmp_path)
+    store.upsert('main', sample_product(1))
+    with open(tmp_path / 'journal.jsonl', 'a') as f:
+        f.write('{"op": "upsert", "col": "main", "product": {"id": "DS-9')   # a crash mid-append
+
+    reopened = open_store(tmp_path)
+    assert [p["id"] for p in reopened.all('main')] == ["DS-1001"]
+    reopened.upsert('main', sample_product(2))
+    assert sorted(p["id"] for p in open_store(tmp_path).all('main')) == ["DS-1001", "DS-1002"]
+
+def test_move_trashes_what_another_process_last_wrote(backend, tmp_path):
+    first, second = open_store(tmp_path), open_store(tmp_path)
+    first.upsert('main', sample_product(1))
+    assert second.get('main', "DS-1001")["price"] == "1001"   # second has read it
+    first.upsert('main', dict(sample_product(1), price="2500"))
+
+    assert second.move("DS-1001", 'trash')
+    assert not second.move("DS-1001", 'trash')
+    assert first.get('trash', "DS-1001")["price"] == "2500"
+    assert first.get('main', "DS-1001") is None
+
+@pytest.mark.parametrize('storage', ['json', 'sqlite'])
+def test_move_product_trashes_and_restores(make_client, storage):
+    client = make_client(STORAGE_BACKEND=storage)
+    product = sample_product(1)
+    assert client.post('/api/add-product', json=product, headers=client.headers).status_code == 200
+    move = lambda action: client.post('/api/move-product', json={"id": product["id"], "action": action},
+                                      headers=client.headers).status_code
+    assert move('restore') == 404
+    assert move('trash') == 200 and move('trash') == 404
+    assert client.store().get('trash', product["id"])["name"] == product["name"]
+    assert move('restore') == 200
+    assert client.store().get('main', product["id"]) is not None
+
+# --- conditional GET: repeat fetches are 304s until their own collection changes ---
+def revalidate(client, url, response, **headers):
+    return client.get(url, headers=dict(headers, **{'If-None-Match': response.headers['ETag']}))
+
+@pytest.mark.parametrize('encoding', [None, 'gzip'])
+def test_repeat_fetches_are_304_until_their_collection_changes(backend, make_client, encoding):
+    client = make_client()
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    with open(backend.FOOTER_FILE, 'w') as f:
+        json.dump({"phone": "123"}, f)
+    for i in range(3):
+        assert client.post('/api/add-product', json=sample_product(i), headers=client.headers).status_code == 200
+
+    urls = ['/api/products', '/data.json', '/footer.json', '/api/products?source=unfilled']
+    first = {url: client.get(url, headers=headers) for url in urls}
+    for url, response in first.items():
+        assert response.status_code == 200 and response.headers['ETag']
+        again = revalidate(client, url, response, **headers)
+        assert again.status_code == 304, url
+        assert again.data == b''
+        assert again.headers['ETag'] == response.headers['ETag']
+
+    # a draft only touches unfilled; the storefront listings stay valid
+    draft = dict(sample_product(10), name="Draft")
+    assert client.post('/api/save-incomplete', json=draft, headers=client.headers).status_code == 200
+    for url in ['/api/products', '/data.json', '/footer.json']:
+        assert revalidate(client, url, first[url], **headers).status_code == 304, url
+    changed = revalidate(client, '/api/products?source=unfilled', first['/api/products?source=unfilled'], **headers)
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first['/api/products?source=unfilled'].headers['ETag']
+
+    # publishing changes main, and with it /api/products and /data.json
+    assert client.post('/api/add-product', json=sample_product(11), headers=client.headers).status_code == 200
+    for url in ['/api/products', '/data.json']:
+        response = revalidate(client, url, first[url], **headers)
+        assert response.status_code == 200, url
+        assert response.data
+    assert revalidate(client, '/footer.json', first['/footer.json'], **headers).status_code == 304
+
+    os.utime(backend.FOOTER_FILE, ns=(0, 0))
+    assert revalidate(client, '/footer.json', first['/footer.json'], **headers).status_code == 200
+
+# --- resumable chunked uploads ---
+def start_upload(client, data, **fields):
+    body = dict({"filename": "clip.mp4", "size": len(data)}, **fields)
+    response = client.post('/api/uploads', json=body, headers=client.headers)
+    assert response.status_code == 200
+    return response.json["upload_id"]
+
+def put_chunk(client, upload_id, offset, **kwargs):
+    return client.put(f'/api/uploads/{upload_id}?offset={offset}', headers=client.headers, **kwargs)
+
+def test_upload_resumes_after_a_chunk_is_cut_off(backend, make_client):
+    client = make_client()
+    data = os.urandom(300 * 1024)
+    upload_id = start_upload(client, data, sha256=hashlib.sha256(data).hexdigest())
+
+    assert put_chunk(client, upload_id, 0, data=data[:100 * 1024]).json["offset"] == 100 * 1024
+    # the connection drops 50KB into a 200KB chunk: the request declares more than arrives
+    cut = put_chunk(client, upload_id, 100 * 1024,
+                    input_stream=io.BytesIO(data[100 * 1024:150 * 1024]),
+                    environ_overrides={'CONTENT_LENGTH': str(200 * 1024)})
+    assert cut.status_code == 400
+    status = client.get(f'/api/uploads/{upload_id}', headers=client.headers).json
+    assert status == {"offset": 150 * 1024, "size": len(data)}
+
+    resumed = put_chunk(client, upload_id, status["offset"], data=data[status["offset"]:])
+    assert resumed.json == {"offset": len(data), "size": len(data)}
+    done = client.post(f'/api/uploads/{upload_id}/complete', json={}, headers=client.headers)
+    assert done.status_code == 200
+    with open(os.path.join(backend.BASE_DIR, done.json["url"]), 'rb') as f:
+        assert f.read() == data
+
+def test_upload_rejects_an_offset_past_what_it_has(backend, make_client):
+    client = make_client()
+    data = os.urandom(64 * 1024)
+    upload_id = start_upload(client, data)
+    assert put_chunk(client, upload_id, 0, data=data[:1000]).status_code == 200
+
+    ahead = put_chunk(client, upload_id, 2000, data=data[2000:3000])
+    assert ahead.status_code == 409
+    assert ahead.json["offset"] == 1000
+    assert client.get(f'/api/uploads/{upload_id}', headers=client.headers).json["offset"] == 1000
+    # re-sending from an earlier offset is fine and overwrites from there
+    assert put_chunk(client, upload_id, 500, data=data[500:]).json["offset"] == len(data)
+
+def test_upload_checksum_mismatch_starts_over(backend, make_client):
+    client = make_client()
+    data = os.urandom(64 * 1024)
+    upload_id = start_upload(client, data, sha256=hashlib.sha256(b"something else").hexdigest())
+    assert put_chunk(client, upload_id, 0, data=data).json["offset"] == len(data)
+
+    bad = client.post(f'/api/uploads/{upload_id}/complete', json={}, headers=client.headers)
+    assert bad.status_code == 422
+    assert bad.json["offset"] == 0
+    assert client.get(f'/api/uploads/{upload_id}', headers=client.headers).json["offset"] == 0
+    assert put_chunk(client, upload_id, 1, data=data[1:]).status_code == 409
+
+    assert put_chunk(client, upload_id, 0, data=data).json["offset"] == len(data)
+    done = client.post(f'/api/uploads/{upload_id}/complete', json={"sha256": hashlib.sha256(data).hexdigest()},
+                       headers=client.headers)
+    assert done.status_code == 200
+
+# --- bulk operations: bad rows are reported by index, the rest still apply ---
+def test_bulk_reports_malformed_rows_and_applies_the_rest(make_client):
+    client = make_client()
+    ops = [{"product": [1, 2]}, {"product": "DS-1"}, 7, {"product": sample_product(1)}, {"op": "trash", "id": 5}]
+    response = client.post('/api/bulk', json={"ops": ops}, headers=client.headers)
+    assert response.status_code == 200
+    assert response.json["applied"] == 1
+    assert [(e["index"], e["error"]) for e in response.json["errors"]] == [
+        (0, "Missing product"), (1, "Missing product"), (2, "Invalid row"), (4, "Invalid product ID")]
+
+def test_bulk_import_numbers_errors_by_input_row(make_client):
+    client = make_client()
+    body = '\n'.join(['{"id": "bad id!", "name": "a"}', '{not json', '[1, 2]',
+                      json.dumps(sample_product(1)), '"text"', json.dumps(sample_product(2))]) + '\n'
+    response = client.post('/api/bulk/import?format=jsonl', data=body, headers=client.headers)
+    assert response.status_code == 200
+    assert response.json["applied"] == 2
+    assert [e["index"] for e in response.json["errors"]] == [0, 1, 2, 4]
+    assert response.json["errors"][1]["error"].startswith("Unreadable row")
+
+    # CSV that cannot be decoded ends the import as an error row numbered after the rows
+    # read so far (decoding goes a buffer at a time), and those rows still apply
+    rows = b'id,name\nDS-1100,ok\n' + b'DS-1101,x\n' * 2000 + b'DS-1102,\xff\n'
+    response = client.post('/api/bulk/import?format=csv', data=rows, headers=client.headers)
+    assert response.status_code == 200
+    errors = response.json["errors"]
+    assert len(errors) == 1 and errors[0]["error"].startswith("Unreadable row")
+    assert response.json["applied"] > 0
+    assert errors[0]["index"] == response.json["applied"]
+
+# --- image uploads ---
+def jpeg(color=(120, 0, 0)):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buf, 'JPEG')
+    return buf.getvalue()
+
+def upload(client, data, filename='photo.jpg'):
+    # (url, finished job) for a single-request upload
+    response = client.post('/api/upload', data={'file': (io.BytesIO(data), filename)}, headers=client.headers,
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    for _ in range(200):
+        job = client.get(f'/api/upload/{response.json["job_id"]}', headers=client.headers).json
+        if job["status"] in ('done', 'error'):
+            return response.json["url"], job
+        time.sleep(0.02)
+    raise AssertionError(f"job never finished: {job}")
+
+def test_another_worker_reports_the_job_and_publishes_the_upload(backend, make_client):
+    taker, other = make_client(), make_client()
+    response = taker.post('/api/upload', data={'file': (io.BytesIO(jpeg()), 'photo.jpg')},
+                          headers=taker.headers, content_type='multipart/form-data')
+    backend.wait_for_image(response.json["url"])
+    backend.upload_futures.clear()   # the other process never saw the future
+
+    job = other.get(f'/api/upload/{response.json["job_id"]}', headers=other.headers)
+    assert job.status_code == 200
+    assert job.json["status"] == 'done' and job.json["url"] == response.json["url"]
+    product = dict(sample_product(1), mainImage=response.json["url"], gallery=[])
+    assert other.post('/api/add-product', json=product, headers=other.headers).status_code == 200
+    assert other.get('/api/upload/0123456789ab', headers=other.headers).status_code == 404
+
+def test_publish_rejects_an_upload_whose_processing_failed(backend, make_client):
+    client = make_client()
+    broken, job = upload(client, b'not really a jpeg')
+    assert job["status"] == 'error'
+    good, _ = upload(client, jpeg())
+
+    product = dict(sample_product(1), mainImage=broken, gallery=[good])
+    response = client.post('/api/add-product', json=product, headers=client.headers)
+    assert response.status_code == 400
+    assert client.store().get('main', product["id"]) is None
+    # nothing was moved: the good upload is still in the buffer for the next try
+    assert os.path.exists(os.path.join(backend.BASE_DIR, good))
+
+def test_gc_keeps_an_old_upload_that_is_being_published(backend, make_client):
+    client = make_client()
+    url, job = upload(client, jpeg())
+    assert job["status"] == 'done'
+    buffered = os.path.join(backend.BASE_DIR, url)
+    os.utime(buffered, (time.time() - 7200, time.time() - 7200))
+
+    # a GC pass lands between finalizing the image and storing the product
+    path = backend.finalize_filename(url)
+    collector = client.application.extensions['dashami'].image_gc
+    collector.run(force=True)
+    assert os.path.exists(os.path.join(backend.BASE_DIR, path))
+
+def test_perm_delete_waits_for_a_publish_that_reuses_its_image(backend, make_client):
+    client = make_client()
+    url, _ = upload(client, jpeg())
+    owner = dict(sample_product(1), mainImage=url, gallery=[])
+    assert client.post('/api/add-product', json=owner, headers=client.headers).status_code == 200
+    image = client.store().get('main', owner["id"])["image"]
+    assert client.post('/api/move-product', json={"id": owner["id"], "action": "trash"},
+                       headers=client.headers).status_code == 200
+
+    # the same picture uploaded again is reused from images/ while its only owner is deleted
+    again, _ = upload(client, jpeg())
+    results = []
+    delete = threading.Thread(target=lambda: results.append(
+        client.post('/api/perm-delete', json={"id": owner["id"]}, headers=client.headers).status_code))
+    with backend.publishing():
+        assert backend.finalize_filename(again) == image
+        delete.start()
+        delete.join(0.3)
+        assert delete.is_alive()
+        client.store().upsert('main', dict(sample_product(2), image=image, gallery=[]))
+    delete.join()
+    assert results == [200]
+    assert os.path.exists(os.path.join(backend.BASE_DIR, image))
+
+def test_gc_drops_the_uploads_of_an_expired_draft(backend, make_client):
+    client = make_client(DRAFT_TTL=0.5)
+    url, _ = upload(client, jpeg())
+    assert client.put('/api/drafts/tab-1', json={"name": "Kept", "mainImage": url},
+                      headers=client.headers).status_code == 200
+    buffered = os.path.join(backend.BASE_DIR, url)
+    os.utime(buffered, (time.time() - 7200, time.time() - 7200))
+    collector = client.application.extensions['dashami'].image_gc
+
+    collector.run(force=True)
+    assert os.path.exists(buffered)
+
+    time.sleep(0.6)
+    collector.run(force=True)
+    assert not os.path.exists(buffered)
+    assert client.get('/api/drafts', headers=client.headers).json["drafts"] == []
+
+def test_next_id_is_allocated_only_for_authenticated_posts(make_client):
+    client = make_client()
+    assert client.post('/api/get-next-id').status_code == 401
+    first = client.post('/api/get-next-id', headers=client.headers).json["next_id"]
+    second = client.post('/api/get-next-id', headers=client.headers).json["next_id"]
+    assert first != second